@@ -3,12 +3,20 @@ import os
 import requests
 import logging
 import re  # NEW: Import re for regex manipulation
+import json
+import hashlib
+import threading
+import concurrent.futures
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
 from prompts import (
     REFINE_PROMPT, REFINE_SYSTEM_MESSAGE,
     IMPROVE_PROMPT, IMPROVE_SYSTEM_MESSAGE,
-    SOAP_PROMPT_TEMPLATE, SOAP_SYSTEM_MESSAGE
+    SOAP_PROMPT_TEMPLATE, SOAP_SYSTEM_MESSAGE,
+    SOAP_SECTION_PROMPT_TEMPLATE, SOAP_SECTION_SYSTEM_MESSAGE, SOAP_REDUCE_PROMPT_TEMPLATE
 )
-from settings import SETTINGS, _DEFAULT_SETTINGS
+from settings import SETTINGS, _DEFAULT_SETTINGS, CACHE_FOLDER
+from cache import DiskCache
 
 # Constants for OpenAI API calls
 OPENAI_TEMPERATURE_REFINEMENT = 0.0
@@ -16,10 +24,121 @@ OPENAI_MAX_TOKENS_REFINEMENT = 4000
 OPENAI_TEMPERATURE_IMPROVEMENT = 0.5
 OPENAI_MAX_TOKENS_IMPROVEMENT = 4000
 
+# OpenAI-compatible endpoint and API key variable for each provider
+PROVIDER_ENDPOINTS = {
+    "openai": (None, "OPENAI_API_KEY"),
+    "perplexity": ("https://api.perplexity.ai", "PERPLEXITY_API_KEY"),
+    "grok": ("https://api.x.ai/v1", "GROK_API_KEY"),
+}
+
+_clients: Dict[Tuple[str, Optional[str]], Tuple[str, openai.OpenAI]] = {}
+_clients_lock = threading.Lock()
+
+def get_client(provider: str, base_url: Optional[str] = None, api_key: Optional[str] = None) -> Optional[openai.OpenAI]:
+    """Return the shared client for ``provider``, or None if it has no API key.
+
+    One client (and so one keep-alive connection pool) is kept per provider and
+    base URL and shared by all threads. It is rebuilt only when the API key changes,
+    e.g. after the key is entered in a dialog.
+    """
+    default_url, key_var = PROVIDER_ENDPOINTS[provider]
+    base_url = base_url or default_url
+    if api_key is None:
+        api_key = (openai.api_key if provider == "openai" else None) or os.getenv(key_var)
+    if not api_key:
+        return None
+    with _clients_lock:
+        cached = _clients.get((provider, base_url))
+        if cached and cached[0] == api_key:
+            return cached[1]
+        client = openai.OpenAI(api_key=api_key, base_url=base_url)
+        # A replaced client is left to the garbage collector; another thread may still be using it
+        _clients[(provider, base_url)] = (api_key, client)
+        return client
+
+class ResponseCache:
+    """LLM responses keyed by everything that determines them.
+
+    A small in-memory LRU sits in front of an optional ``DiskCache`` (which
+    applies its own size limit and TTL), so a repeated request in the same
+    session is answered from memory and one from an earlier session from disk.
+    """
+
+    def __init__(self, memory_entries: int = 64, disk: Optional[DiskCache] = None) -> None:
+        self.memory_entries = memory_entries
+        self.disk = disk
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(provider: str, model: str, system_message: str, prompt: str, temperature: float, max_tokens: int) -> str:
+        # Hash the request so prompts (patient text) are not written to disk as part of the key
+        request = json.dumps([provider, model, system_message, prompt, temperature, max_tokens])
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        value = self.disk.get(key) if self.disk else None
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self._remember(key, value)
+        if self.disk:
+            self.disk.set(key, value)
+
+    def _remember(self, key: str, value: str) -> None:
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        if self.disk:
+            self.disk.clear()
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Return the shared response cache, or None when caching is switched off in settings."""
+    global _response_cache
+    if not SETTINGS.get("ai_cache_enabled", True):
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            disk = None
+            try:
+                disk = DiskCache(
+                    os.path.join(CACHE_FOLDER, "responses"),
+                    max_bytes=int(SETTINGS.get("ai_cache_mb", 20) * 1024 * 1024),
+                    ttl_seconds=SETTINGS.get("ai_cache_ttl_hours", 168) * 3600
+                )
+            except Exception:
+                logging.error("Error opening AI response cache; using memory only", exc_info=True)
+            _response_cache = ResponseCache(disk=disk)
+        return _response_cache
+
+def clear_response_cache() -> None:
+    cache = get_response_cache()
+    if cache:
+        cache.clear()
+
 def call_openai(model: str, system_message: str, prompt: str, temperature: float, max_tokens: int) -> str:
     try:
         logging.info(f"Making OpenAI API call with model: {model}")
-        response = openai.chat.completions.create(
+        client = get_client("openai")
+        if client is None:
+            logging.error("OpenAI API key not provided")
+            return prompt
+        response = client.chat.completions.create(
             model=model,
             messages=[
                 {"role": "system", "content": system_message},
@@ -33,17 +152,11 @@ def call_openai(model: str, system_message: str, prompt: str, temperature: float
         logging.error(f"OpenAI API error with model {model}: {str(e)}")
         return prompt
 
-def call_perplexity(system_message: str, prompt: str, temperature: float, max_tokens: int) -> str:
-    from openai import OpenAI
-    api_key = os.getenv("PERPLEXITY_API_KEY")
-    if not api_key:
+def call_perplexity(model: str, system_message: str, prompt: str, temperature: float, max_tokens: int) -> str:
+    client = get_client("perplexity")
+    if client is None:
         logging.error("Perplexity API key not provided")
         return prompt
-    client = OpenAI(api_key=api_key, base_url="https://api.perplexity.ai")
-    
-    # Get model from the appropriate settings based on the task
-    model_key = get_model_key_for_task(system_message, prompt)
-    model = SETTINGS.get(model_key, {}).get("perplexity_model", "sonar-medium-chat")
     logging.info(f"Making Perplexity API call with model: {model}")
     
     messages = [
@@ -64,22 +177,42 @@ def call_perplexity(system_message: str, prompt: str, temperature: float, max_to
         return prompt
 
 # Updated call_ai function with more detailed logging
-def call_ai(model: str, system_message: str, prompt: str, temperature: float, max_tokens: int) -> str:
-    provider = SETTINGS.get("ai_provider", "openai")
-    model_key = get_model_key_for_task(system_message, prompt)
-    
+def call_ai(model: str, system_message: str, prompt: str, temperature: float, max_tokens: int,
+            use_cache: bool = True) -> str:
+    provider, model_key, actual_model = resolve_model(model, system_message, prompt)
+    # With use_cache=False a fresh response is requested; it still replaces the cached one
+    cache = get_response_cache()
+    cache_key = ResponseCache.make_key(provider, actual_model, system_message, prompt, temperature, max_tokens)
+    if cache and use_cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logging.info(f"Using cached {provider} response for task: {model_key}")
+            return cached
+
     # Handle different providers and get appropriate model
     if provider == "perplexity":
         logging.info(f"Using provider: Perplexity for task: {model_key}")
-        return call_perplexity(system_message, prompt, temperature, max_tokens)
+        result = call_perplexity(actual_model, system_message, prompt, temperature, max_tokens)
     elif provider == "grok":
-        actual_model = SETTINGS.get(model_key, {}).get("grok_model", "grok-1")
         logging.info(f"Using provider: Grok with model: {actual_model}")
-        return call_grok(actual_model, system_message, prompt, temperature, max_tokens)
+        result = call_grok(actual_model, system_message, prompt, temperature, max_tokens)
     else:  # OpenAI is the default
-        actual_model = SETTINGS.get(model_key, {}).get("model", model)
         logging.info(f"Using provider: OpenAI with model: {actual_model}")
-        return call_openai(actual_model, system_message, prompt, temperature, max_tokens)
+        result = call_openai(actual_model, system_message, prompt, temperature, max_tokens)
+    # The provider calls return the prompt itself on failure; never cache that
+    if cache and result and result != prompt:
+        cache.set(cache_key, result)
+    return result
+
+def resolve_model(model: str, system_message: str, prompt: str) -> Tuple[str, str, str]:
+    """Return the provider, task settings key and model that ``call_ai`` will use."""
+    provider = SETTINGS.get("ai_provider", "openai")
+    model_key = get_model_key_for_task(system_message, prompt)
+    if provider == "perplexity":
+        return provider, model_key, SETTINGS.get(model_key, {}).get("perplexity_model", "sonar-medium-chat")
+    if provider == "grok":
+        return provider, model_key, SETTINGS.get(model_key, {}).get("grok_model", "grok-1")
+    return "openai", model_key, SETTINGS.get(model_key, {}).get("model", model)
 
 # Helper function to determine which model key to use based on the task
 def get_model_key_for_task(system_message: str, prompt: str) -> str:
@@ -95,15 +228,13 @@ def get_model_key_for_task(system_message: str, prompt: str) -> str:
 
 # NEW: Add Grok API call function
 def call_grok(model: str, system_message: str, prompt: str, temperature: float, max_tokens: int) -> str:
-    from openai import OpenAI
-    api_key = os.getenv("GROK_API_KEY")
-    if not api_key:
+    client = get_client("grok")
+    if client is None:
         logging.error("Grok API key not provided")
         return prompt
     
     logging.info(f"Making Grok API call with model: {model}")
     
-    client = OpenAI(api_key=api_key, base_url="https://api.x.ai/v1")
     messages = [
         {"role": "system", "content": system_message},
         {"role": "user", "content": prompt}
@@ -120,15 +251,299 @@ def call_grok(model: str, system_message: str, prompt: str, temperature: float,
         logging.error(f"Grok API error with model {model}: {str(e)}")
         return prompt
 
-def adjust_text_with_openai(text: str) -> str:
+def call_ai_stream(model: str, system_message: str, prompt: str, temperature: float, max_tokens: int) -> Iterator[str]:
+    """Like ``call_ai`` but yields the completion in pieces as the provider generates it.
+
+    A cached response is yielded in one piece; a completed stream is cached.
+    Unlike ``call_ai`` the prompt is never returned in place of a response:
+    ``RuntimeError`` is raised when the call fails, breaks off part way or
+    produces no text, so callers can tell a partial response from a whole one.
+    """
+    provider, model_key, actual_model = resolve_model(model, system_message, prompt)
+    cache = get_response_cache()
+    cache_key = ResponseCache.make_key(provider, actual_model, system_message, prompt, temperature, max_tokens)
+    if cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logging.info(f"Using cached {provider} response for task: {model_key}")
+            yield cached
+            return
+    # Perplexity calls are made without temperature and token limits, as in call_perplexity
+    options = {} if provider == "perplexity" else {"temperature": temperature, "max_tokens": max_tokens}
+    logging.info(f"Streaming {provider} API call with model: {actual_model}")
+
+    client = get_client(provider)
+    if client is None:
+        logging.error(f"{provider.capitalize()} API key not provided")
+        raise RuntimeError(f"{provider.capitalize()} API key not provided")
+    parts = []
+    try:
+        stream = client.chat.completions.create(
+            model=actual_model,
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt}
+            ],
+            stream=True,
+            **options
+        )
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+    except Exception as e:
+        logging.error(f"{provider.capitalize()} streaming API error with model {actual_model}: {str(e)}")
+        raise RuntimeError(f"{provider.capitalize()} API error: {e}") from e
+    # Stored as call_perplexity would return it, so blocking callers can share the entry
+    result = remove_think("".join(parts))
+    if not result:
+        logging.error(f"{provider.capitalize()} returned an empty response with model {actual_model}")
+        raise RuntimeError(f"{provider.capitalize()} returned an empty response")
+    if cache:
+        cache.set(cache_key, result)
+
+class StreamCleaner:
+    """Incrementally applies the clean-up done on complete responses to a token stream.
+
+    ``<think>`` blocks are always dropped. With ``markdown`` the output follows
+    ``remove_markdown`` (and ``remove_citations`` with ``citations``) line by line,
+    and text is released as soon as markup still arriving can no longer change it.
+    Whitespace is held back until more text follows, as ``strip()`` would.
+    """
+
+    THINK_OPEN = "<think>"
+    THINK_CLOSE = "</think>"
+
+    def __init__(self, markdown: bool = True, citations: bool = False) -> None:
+        self.markdown = markdown
+        self.citations = citations
+        self._markup = "*_`[#" if markdown else ("[" if citations else "")
+        self._pending = ""      # Raw text that may be the start of a think tag
+        self._in_think = False
+        self._line = ""         # Current, incomplete line
+        self._line_emitted = 0  # Characters of the current line already released
+        self._in_fence = False
+        self._held = ""         # Whitespace waiting for the next visible text
+        self._held_keep = 0     # Length of the held whitespace that precedes any blank lines
+        self._started = False
+        self._eat_whitespace = False
+
+    def feed(self, delta: str) -> str:
+        return self._lines(self._strip_think(delta, final=False), final=False)
+
+    def finish(self) -> str:
+        return self._lines(self._strip_think("", final=True), final=True)
+
+    def _strip_think(self, delta: str, final: bool) -> str:
+        text = self._pending + delta
+        self._pending = ""
+        out = []
+        while text:
+            tag = self.THINK_CLOSE if self._in_think else self.THINK_OPEN
+            index = text.find(tag)
+            if index >= 0:
+                if not self._in_think:
+                    out.append(text[:index])
+                text = text[index + len(tag):]
+                self._in_think = not self._in_think
+                continue
+            # Hold back a suffix that could be the start of the tag
+            hold = 0 if final else next((n for n in range(min(len(tag) - 1, len(text)), 0, -1) if tag.startswith(text[-n:])), 0)
+            if not self._in_think:
+                out.append(text[:len(text) - hold])
+            self._pending = text[len(text) - hold:]
+            break
+        return "".join(out)
+
+    def _clean_markdown(self, line: str) -> str:
+        if self.markdown:
+            line = re.sub(r"`(.+?)`", r"\1", line)
+            line = re.sub(r"^\s*#+\s*", "", line)
+            line = re.sub(r"(\*\*|__)(.*?)\1", r"\2", line)
+            line = re.sub(r"(\*|_)(.*?)\1", r"\2", line)
+        return line
+
+    def _release(self, text: str) -> str:
+        if not self._started:
+            text = text.lstrip()
+        combined = self._held + text
+        body = combined.rstrip()
+        self._held = combined[len(body):]
+        if body:
+            self._started = True
+            self._held_keep = 0
+        return body
+
+    def _lines(self, text: str, final: bool) -> str:
+        out = []
+        self._line += text
+        while "\n" in self._line:
+            line, self._line = self._line.split("\n", 1)
+            out.append(self._end_line(line, last=False))
+        if final:
+            out.append(self._end_line(self._line, last=True))
+            self._line = ""
+        else:
+            out.append(self._partial_line())
+        return "".join(out)
+
+    def _end_line(self, line: str, last: bool) -> str:
+        emitted, self._line_emitted = self._line_emitted, 0
+        newline = "" if last else "\n"
+        if self.markdown and line.lstrip().startswith("```"):
+            # Code blocks are removed entirely, as remove_markdown does; only the line break after them stays
+            self._in_fence = not self._in_fence
+            return "" if self._in_fence else self._release(newline)
+        if self.markdown and self._in_fence:
+            return ""
+        cleaned = self._clean_markdown(line)
+        if self.markdown and line.lstrip().startswith("#"):
+            # The heading pattern also swallows blank lines before the heading and, for an empty heading, after it
+            self._held = self._held[:self._held_keep]
+            if not cleaned:
+                self._eat_whitespace = self._started
+                return ""
+        blank = not cleaned.strip()
+        if self._eat_whitespace:
+            cleaned = cleaned.lstrip()
+            if not cleaned:
+                return ""
+            self._eat_whitespace = False
+        if self.citations:
+            cleaned = remove_citations(cleaned)
+        released = self._release(cleaned[emitted:] + newline)
+        if not blank:
+            self._held_keep = len(self._held)
+        return released
+
+    def _partial_line(self) -> str:
+        line = self._line
+        stripped = line.lstrip()
+        if self._in_fence or not stripped or (self.markdown and stripped[0] in "#`"):
+            return ""
+        # Release up to the first character that might start markup
+        cut = min([line.find(char) for char in self._markup if char in line] + [len(line)])
+        safe = line[:cut].rstrip()
+        if len(safe) <= self._line_emitted:
+            return ""
+        piece = safe[self._line_emitted:]
+        self._line_emitted = len(safe)
+        if self._eat_whitespace:
+            piece = piece.lstrip()
+            self._eat_whitespace = False
+        return self._release(piece)
+
+def _refine_request(text: str) -> tuple:
     model = SETTINGS.get("refine_text", {}).get("model", _DEFAULT_SETTINGS["refine_text"]["model"])
     full_prompt = f"{REFINE_PROMPT}\n\nOriginal: {text}\n\nCorrected:"
-    return call_ai(model, REFINE_SYSTEM_MESSAGE, full_prompt, OPENAI_TEMPERATURE_REFINEMENT, OPENAI_MAX_TOKENS_REFINEMENT)
+    return model, REFINE_SYSTEM_MESSAGE, full_prompt, OPENAI_TEMPERATURE_REFINEMENT, OPENAI_MAX_TOKENS_REFINEMENT
 
-def improve_text_with_openai(text: str) -> str:
+def _improve_request(text: str) -> tuple:
     model = SETTINGS.get("improve_text", {}).get("model", _DEFAULT_SETTINGS["improve_text"]["model"])
     full_prompt = f"{IMPROVE_PROMPT}\n\nOriginal: {text}\n\nImproved:"
-    return call_ai(model, IMPROVE_SYSTEM_MESSAGE, full_prompt, OPENAI_TEMPERATURE_IMPROVEMENT, OPENAI_MAX_TOKENS_IMPROVEMENT)
+    return model, IMPROVE_SYSTEM_MESSAGE, full_prompt, OPENAI_TEMPERATURE_IMPROVEMENT, OPENAI_MAX_TOKENS_IMPROVEMENT
+
+def adjust_text_with_openai(text: str) -> str:
+    return call_ai(*_refine_request(text))
+
+def improve_text_with_openai(text: str) -> str:
+    return call_ai(*_improve_request(text))
+
+def adjust_text_stream(text: str) -> Iterator[str]:
+    return call_ai_stream(*_refine_request(text))
+
+def improve_text_stream(text: str) -> Iterator[str]:
+    return call_ai_stream(*_improve_request(text))
+
+def remove_think(text: str) -> str:
+    return re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL).strip()
+
+def _checked_call(request: tuple, use_cache: bool = True) -> Optional[str]:
+    # call_ai returns the prompt itself when the request fails; report that as None
+    result = call_ai(*request, use_cache=use_cache)
+    return None if result == request[2] else remove_think(result)
+
+def refine_paragraph(text: str) -> Optional[str]:
+    return _checked_call(_refine_request(text))
+
+def improve_paragraph(text: str) -> Optional[str]:
+    return _checked_call(_improve_request(text))
+
+class ParagraphProcessor:
+    """Runs a text operation only on the paragraphs that changed since it last ran.
+
+    Paragraphs are separated by blank lines, so a paragraph keeps its headings
+    and list items together as context for the model. Every paragraph the
+    operation has produced is remembered by hash; ``plan`` marks a paragraph as
+    done when it is a remembered output, and any other paragraph (including one
+    that grew) is sent again whole. ``run`` processes the pending paragraphs
+    concurrently and merges them back in place.
+    """
+
+    PARAGRAPH_BREAK = r"(\n\s*\n)"
+
+    def __init__(self, process_func, max_workers: int = 4, max_remembered: int = 1000) -> None:
+        self.process_func = process_func
+        self.max_workers = max_workers
+        self.max_remembered = max_remembered
+        self._done: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def remember_text(self, text: str) -> None:
+        with self._lock:
+            for paragraph in re.split(self.PARAGRAPH_BREAK, text):
+                core = paragraph.strip()
+                if core:
+                    key = self._hash(core)
+                    self._done[key] = None
+                    self._done.move_to_end(key)
+            while len(self._done) > self.max_remembered:
+                self._done.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._done.clear()
+
+    def plan(self, text: str) -> List[Tuple[str, bool]]:
+        """Split ``text`` into ``(segment, needs_processing)`` pairs that concatenate back to it."""
+        plan = []
+        with self._lock:
+            for part in re.split(self.PARAGRAPH_BREAK, text):
+                core = part.strip()
+                if not core:
+                    plan.append((part, False))
+                    continue
+                start = part.index(core)
+                plan.append((part[:start], False))
+                plan.append((core, self._hash(core) not in self._done))
+                plan.append((part[start + len(core):], False))
+        return [(segment, todo) for segment, todo in plan if segment]
+
+    def run(self, plan: List[Tuple[str, bool]]) -> Tuple[str, int]:
+        """Process the pending segments of ``plan``; returns the merged text and how many failed."""
+        pending = [i for i, (_, todo) in enumerate(plan) if todo]
+        results = [segment for segment, _ in plan]
+        failed = set()
+        if pending:
+            workers = max(1, min(self.max_workers, len(pending)))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="paragraph") as pool:
+                outputs = pool.map(lambda i: self.process_func(plan[i][0]), pending)
+                for i, output in zip(pending, outputs):
+                    if output:
+                        results[i] = output.strip()
+                    else:
+                        failed.add(i)
+        # A failed paragraph keeps its text and is retried next time, so it is not remembered.
+        # Pending segments never contain a blank line, so a marker in their place stays in its own paragraph.
+        marked = "".join("\0" if i in failed else segment for i, segment in enumerate(results))
+        self.remember_text("\n\n".join(part for part in re.split(self.PARAGRAPH_BREAK, marked)
+                                       if part.strip() and "\0" not in part))
+        return "".join(results), len(failed)
 
 # NEW: Helper function to remove markdown formatting from text
 def remove_markdown(text: str) -> str:
@@ -148,14 +563,88 @@ def remove_markdown(text: str) -> str:
 def remove_citations(text: str) -> str:
     return re.sub(r'(\[\d+\])+', '', text)
 
-def create_soap_note_with_openai(text: str) -> str:
-    full_prompt = SOAP_PROMPT_TEMPLATE.format(text=text)
-    result = call_ai("gpt-4o", SOAP_SYSTEM_MESSAGE, full_prompt, 0.7, 4000)
-    cleaned = remove_markdown(result)
+def clean_soap_note(result: str) -> str:
+    cleaned = remove_markdown(remove_think(result))
     # Remove citation markers from the result
     cleaned = remove_citations(cleaned)
     return cleaned.strip()
 
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text; close enough for sizing requests
+    return len(text) // 4 + 1
+
+def split_transcript(text: str, max_tokens: int) -> List[str]:
+    """Split ``text`` into consecutive sections of at most about ``max_tokens`` tokens.
+
+    Sections break between lines where possible, then between sentences, and
+    only split a sentence at word boundaries when it is longer than a section.
+    """
+    max_chars = max(1, max_tokens) * 4
+    units = []
+    for line in text.splitlines():
+        if len(line) <= max_chars:
+            units.append(line)
+            continue
+        for sentence in re.split(r"(?<=[.!?])\s+", line):
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(" ", 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                units.append(sentence[:cut])
+                sentence = sentence[cut:].lstrip()
+            units.append(sentence)
+    sections, current = [], ""
+    for unit in units:
+        if current and len(current) + 1 + len(unit) > max_chars:
+            sections.append(current)
+            current = unit
+        else:
+            current = f"{current}\n{unit}" if current else unit
+    if current.strip():
+        sections.append(current)
+    return sections
+
+def _extract_section_findings(section: str, index: int, total: int) -> str:
+    prompt = SOAP_SECTION_PROMPT_TEMPLATE.format(text=section, index=index, total=total)
+    result = call_ai("gpt-4o", SOAP_SECTION_SYSTEM_MESSAGE, prompt, 0.0, 1500)
+    if result == prompt:
+        # The call failed; let the final request work from the raw section instead of losing it
+        logging.error(f"Could not extract findings from transcript part {index} of {total}; using the raw text")
+        return section
+    return remove_think(result)
+
+def _soap_request(text: str) -> str:
+    """Return the final SOAP prompt, reducing long transcripts to per-section findings first."""
+    threshold = SETTINGS.get("soap_map_reduce_tokens", 12000)
+    if not threshold or estimate_tokens(text) <= threshold:
+        return SOAP_PROMPT_TEMPLATE.format(text=text)
+    sections = split_transcript(text, SETTINGS.get("soap_section_tokens", 4000))
+    logging.info(f"Long transcript (~{estimate_tokens(text)} tokens); extracting findings from {len(sections)} sections")
+    workers = max(1, min(len(sections), SETTINGS.get("soap_map_concurrency", 4)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="soap-map") as pool:
+        findings = list(pool.map(
+            lambda item: _extract_section_findings(item[1], item[0], len(sections)),
+            enumerate(sections, start=1)
+        ))
+    combined = "\n\n".join(f"Part {i} of {len(sections)}:\n{part}" for i, part in enumerate(findings, start=1))
+    return SOAP_REDUCE_PROMPT_TEMPLATE.format(text=combined)
+
+def create_soap_note_with_openai(text: str) -> str:
+    return clean_soap_note(call_ai("gpt-4o", SOAP_SYSTEM_MESSAGE, _soap_request(text), 0.7, 4000))
+
+def create_soap_note_checked(text: str) -> str:
+    """Like ``create_soap_note_with_openai`` but raises ``RuntimeError`` instead of returning the prompt on failure."""
+    result = _checked_call(("gpt-4o", SOAP_SYSTEM_MESSAGE, _soap_request(text), 0.7, 4000))
+    if not result:
+        raise RuntimeError("the AI provider did not return a SOAP note")
+    return clean_soap_note(result)
+
+def create_soap_note_stream(text: str) -> Iterator[str]:
+    """Raw SOAP note deltas; clean them with ``StreamCleaner(citations=True)`` and ``clean_soap_note``.
+
+    For long transcripts the section findings are extracted before the first delta is yielded.
+    """
+    yield from call_ai_stream("gpt-4o", SOAP_SYSTEM_MESSAGE, _soap_request(text), 0.7, 4000)
+
 def create_referral_with_openai(text: str, conditions: str = "") -> str:
     # Add conditions to the prompt if provided
     if conditions:
@@ -166,15 +655,14 @@ def create_referral_with_openai(text: str, conditions: str = "") -> str:
         logging.info("Creating referral with no specific focus conditions")
     
     # Add a shorter timeout and increase max tokens slightly
-    try:
-        result = call_ai(
-            "gpt-4o", 
-            "You are a physician writing referral letters to other physicians. Be concise but thorough.", 
-            new_prompt, 
-            0.7, 
-            500  # Increased from 250 to give more space for the response
-        )
-        return remove_markdown(result)
-    except Exception as e:
-        logging.error(f"Error creating referral: {str(e)}")
-        return f"Error creating referral: {str(e)}"
+    result = _checked_call((
+        "gpt-4o", 
+        "You are a physician writing referral letters to other physicians. Be concise but thorough.", 
+        new_prompt, 
+        0.7, 
+        500  # Increased from 250 to give more space for the response
+    ), use_cache=False)  # Each Referral click asks for a new referral rather than the cached one
+    # Raised rather than returned so a failed referral is never reused as a prefetched result
+    if not result:
+        raise RuntimeError("the AI provider did not return a referral")
+    return remove_markdown(result)
@@ -2,13 +2,13 @@ import os
 import json
 import string
 import logging
+import hashlib
+import threading
 import concurrent.futures
-from io import BytesIO
 import tkinter as tk
 from tkinter import messagebox, filedialog, scrolledtext
 import speech_recognition as sr
 from pydub import AudioSegment
-from deepgram import DeepgramClient, PrerecordedOptions
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 from dotenv import load_dotenv
@@ -16,9 +16,19 @@ import openai
 import pyaudio
 from typing import Callable, Optional
 
-from utils import get_valid_microphones
-from ai import adjust_text_with_openai, improve_text_with_openai, create_soap_note_with_openai
+from utils import MicrophoneRegistry
+from ai import (
+    adjust_text_with_openai, improve_text_with_openai, create_soap_note_with_openai,
+    adjust_text_stream, improve_text_stream, create_soap_note_stream,
+    StreamCleaner, clean_soap_note, remove_think, clear_response_cache,
+    ParagraphProcessor, refine_paragraph, improve_paragraph
+)
+from transcription import IncrementalTranscriber, OrderedTranscriptionPipeline, transcribe_file
 from tooltip import ToolTip
+from audio import SpillAudioStore, VoiceActivityDetector, WavAppendWriter, normalize_capture
+from engines import Transcriber, VoskEngine, ENGINE_NAMES, ENGINE_DISPLAY_NAMES
+from streaming import DeepgramStreamingClient, stream_microphone, DEEPGRAM_LIVE_URL
+from capture import ChunkStats, listen_adaptive
 from settings import SETTINGS
 from dialogs import create_toplevel_dialog, show_settings_dialog, askstring_min, ask_conditions_dialog
 
@@ -40,14 +50,42 @@ class MedicalDictationApp(ttk.Window):
         self.recognition_language = os.getenv("RECOGNITION_LANGUAGE", "en-US")
         self.deepgram_api_key = deepgram_api_key
         self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
-        self.deepgram_client = DeepgramClient(api_key=self.deepgram_api_key) if self.deepgram_api_key else None
+        self.transcriber = Transcriber(SETTINGS, self.recognition_language, on_failover=self._on_engine_failover)
+        self.engines = self.transcriber.engines
 
         self.appended_chunks = []
         self.capitalize_next = False
-        self.audio_segments = []
+        # Session audio is spilled to temporary files so memory stays flat during long sessions
+        self.audio_buffer = SpillAudioStore()
         self.soap_recording = False
-        self.soap_audio_segments = []
+        self.soap_audio_buffer = SpillAudioStore()
         self.soap_stop_listening_function = None
+        self.soap_wav_writer = None
+        self.soap_incremental = False
+        # Silence is trimmed from every recorded chunk before it is uploaded
+        self.vad = VoiceActivityDetector(threshold_db=SETTINGS.get("vad_threshold_db", -45.0))
+        # Refine and Improve only resend paragraphs that changed since they last ran
+        paragraph_workers = SETTINGS.get("paragraph_max_concurrency", 4)
+        self.refine_paragraphs = ParagraphProcessor(refine_paragraph, max_workers=paragraph_workers)
+        self.improve_paragraphs = ParagraphProcessor(improve_paragraph, max_workers=paragraph_workers)
+        # Referral steps started speculatively, keyed by kind, text hash and focus
+        self.referral_prefetch = {}
+        self.referral_prefetch_lock = threading.Lock()
+        # Chunk sizes and cut latencies from the adaptive phrase chunker, for tuning its settings
+        self.chunk_stats = ChunkStats()
+        self.soap_transcriber = IncrementalTranscriber(
+            lambda segment: self._transcribe_speech(segment, "soap_note"), self.executor,
+            on_update=lambda: self.after(0, self._show_running_soap_transcript)
+        )
+        # Live dictation phrases transcribe in parallel but reach the text widget in capture order
+        self.dictation_pipeline = OrderedTranscriptionPipeline(
+            lambda segment: self._transcribe_speech(segment, "dictation"),
+            on_result=lambda text: self.after(0, self.handle_recognized_text, text),
+            max_concurrency=SETTINGS.get("dictation_max_concurrency", 4),
+            max_queued=SETTINGS.get("dictation_max_queued", 8),
+            overflow=SETTINGS.get("dictation_queue_overflow", "merge"),
+            on_queue_change=lambda queued, in_flight: self.after(0, self._show_queue_depth, queued, in_flight)
+        )
 
         self.create_menu()
         self.create_widgets()
@@ -87,6 +125,20 @@ class MedicalDictationApp(ttk.Window):
         settings_menu.add_command(label="Export Prompts", command=self.export_prompts)
         settings_menu.add_command(label="Import Prompts", command=self.import_prompts)
         settings_menu.add_command(label="Set Storage Folder", command=self.set_default_folder)
+        engine_menu = tk.Menu(settings_menu, tearoff=0)
+        self.engine_vars = {}
+        for task, label in (("dictation", "Dictation"), ("soap_note", "SOAP Recording"), ("import", "Audio Import"), ("fallback", "Fallback")):
+            task_menu = tk.Menu(engine_menu, tearoff=0)
+            var = tk.StringVar(value=SETTINGS.get("transcription_engines", {}).get(task, "google" if task == "fallback" else "deepgram"))
+            for name in ENGINE_NAMES:
+                task_menu.add_radiobutton(label=ENGINE_DISPLAY_NAMES[name], value=name, variable=var,
+                                          command=lambda t=task, v=var: self.set_transcription_engine(t, v.get()))
+            engine_menu.add_cascade(label=label, menu=task_menu)
+            self.engine_vars[task] = var
+        engine_menu.add_separator()
+        engine_menu.add_command(label="Set Vosk Model Folder", command=self.set_vosk_model_folder)
+        settings_menu.add_cascade(label="Transcription Engine", menu=engine_menu)
+        settings_menu.add_command(label="Clear AI Response Cache", command=self.clear_ai_cache)
         menubar.add_cascade(label="Settings", menu=settings_menu)
 
         helpmenu = tk.Menu(menubar, tearoff=0)
@@ -107,6 +159,35 @@ class MedicalDictationApp(ttk.Window):
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to set folder: {e}")
 
+    def set_transcription_engine(self, task: str, engine_name: str) -> None:
+        from settings import SETTINGS, save_settings
+        SETTINGS.setdefault("transcription_engines", {})[task] = engine_name
+        save_settings(SETTINGS)
+        if not self.engines[engine_name].is_available():
+            self.update_status(f"{ENGINE_DISPLAY_NAMES[engine_name]} is not configured; the fallback engine will be used.", status_type="warning")
+        else:
+            self.update_status(f"{ENGINE_DISPLAY_NAMES[engine_name]} selected for {task.replace('_', ' ')}.")
+
+    def clear_ai_cache(self) -> None:
+        try:
+            clear_response_cache()
+            self.update_status("AI response cache cleared.", status_type="success")
+        except Exception as e:
+            logging.error("Error clearing AI response cache", exc_info=True)
+            self.update_status(f"Error clearing AI response cache: {e}", status_type="error")
+
+    def set_vosk_model_folder(self) -> None:
+        folder = filedialog.askdirectory(title="Select Vosk Model Folder")
+        if folder:
+            from settings import SETTINGS, save_settings
+            SETTINGS["vosk_model_path"] = folder
+            save_settings(SETTINGS)
+            self.engines["vosk"] = VoskEngine(folder)
+            if self.engines["vosk"].is_available():
+                self.update_status(f"Vosk model folder set to: {folder}")
+            else:
+                self.update_status("Vosk is not installed or the folder is not a Vosk model.", status_type="warning")
+
     def export_prompts(self) -> None:
         from settings import SETTINGS, _DEFAULT_SETTINGS
         data = {}
@@ -155,13 +236,18 @@ class MedicalDictationApp(ttk.Window):
         mic_frame = ttk.Frame(self, padding=10)
         mic_frame.pack(side=TOP, fill=tk.X, padx=20, pady=(20, 10))
         ttk.Label(mic_frame, text="Select Microphone:").pack(side=LEFT, padx=(0, 10))
-        self.mic_names = get_valid_microphones() or sr.Microphone.list_microphone_names()
-        self.mic_combobox = ttk.Combobox(mic_frame, values=self.mic_names, state="readonly", width=50)
+        # Devices are enumerated on a background thread; the combobox is filled when the first scan finishes
+        self.mic_devices = []
+        self.mic_refresh_requested = False
+        self.mic_combobox = ttk.Combobox(mic_frame, values=[], state="readonly", width=50)
         self.mic_combobox.pack(side=LEFT)
-        if self.mic_names:
-            self.mic_combobox.current(0)
-        else:
-            self.mic_combobox.set("No microphone found")
+        self.mic_combobox.set("Detecting microphones...")
+        self.mic_registry = MicrophoneRegistry(
+            on_change=lambda devices: self.after(0, self._update_microphones, devices),
+            is_busy=lambda: self.listening or self.soap_recording
+        )
+        # Start scanning once the main loop runs so results can be posted back with after()
+        self.after(0, self.mic_registry.start)
         refresh_btn = ttk.Button(mic_frame, text="Refresh", command=self.refresh_microphones, bootstyle="PRIMARY")
         refresh_btn.pack(side=LEFT, padx=10)
         ToolTip(refresh_btn, "Refresh the list of available microphones.")
@@ -354,6 +440,10 @@ class MedicalDictationApp(ttk.Window):
             foreground="gray"
         )
         self.provider_indicator.pack(side=LEFT, padx=(0, 10))
+
+        # Live dictation backlog; empty while transcription keeps up
+        self.queue_indicator = ttk.Label(status_frame, text="", anchor="e", font=("Segoe UI", 9), foreground="gray")
+        self.queue_indicator.pack(side=LEFT, padx=(0, 10))
         
         self.progress_bar = ttk.Progressbar(status_frame, mode="indeterminate")
         self.progress_bar.pack(side=RIGHT, padx=10)
@@ -523,8 +613,14 @@ class MedicalDictationApp(ttk.Window):
                 widget.edit_reset()  # Clear undo/redo history
             # Clear audio segments and other stored data
             self.appended_chunks.clear()
-            self.audio_segments.clear()
-            self.soap_audio_segments.clear()
+            self.audio_buffer.clear()
+            self.soap_audio_buffer.clear()
+            self.soap_transcriber.reset()
+            self.dictation_pipeline.reset()
+            self.vad.reset_stats()
+            self.chunk_stats.reset()
+            self.refine_paragraphs.clear()
+            self.improve_paragraphs.clear()
 
     def save_text(self) -> None:
         text = self.transcript_text.get("1.0", tk.END).strip()
@@ -539,12 +635,9 @@ class MedicalDictationApp(ttk.Window):
             try:
                 with open(file_path, "w", encoding="utf-8") as file:
                     file.write(text)
-                if self.audio_segments:
-                    combined = self.audio_segments[0]
-                    for seg in self.audio_segments[1:]:
-                        combined += seg
+                if self.audio_buffer:
                     base, _ = os.path.splitext(file_path)
-                    combined.export(f"{base}.wav", format="wav")
+                    self.audio_buffer.write_wav(f"{base}.wav")
                     messagebox.showinfo("Save Audio", f"Audio saved as: {base}.wav")
                 messagebox.showinfo("Save Text", "Text saved successfully.")
             except Exception as e:
@@ -560,7 +653,7 @@ class MedicalDictationApp(ttk.Window):
         if messagebox.askyesno("Clear Text", "Clear the text?"):
             self.transcript_text.delete("1.0", tk.END)
             self.appended_chunks.clear()
-            self.audio_segments.clear()
+            self.audio_buffer.clear()
 
     def append_text(self, text: str) -> None:
         current = self.transcript_text.get("1.0", "end-1c")
@@ -652,13 +745,16 @@ class MedicalDictationApp(ttk.Window):
             self.update_status("Listening...")
             try:
                 import speech_recognition as sr
-                selected_index = self.mic_combobox.current()
-                mic = sr.Microphone(device_index=selected_index)
+                mic = sr.Microphone(device_index=self._selected_device_index())
             except Exception as e:
                 logging.error("Error creating microphone", exc_info=True)
                 self.update_status("Error accessing microphone.")
                 return
-            self.stop_listening_function = self.recognizer.listen_in_background(mic, self.callback, phrase_time_limit=10)
+            if SETTINGS.get("streaming_dictation", False) and self.deepgram_api_key:
+                if not self._start_streaming_dictation(mic):
+                    return
+            else:
+                self.stop_listening_function = listen_adaptive(self.recognizer, mic, self.callback, SETTINGS, self.chunk_stats)
             self.listening = True
             self.record_button.config(state=DISABLED)
             self.stop_button.config(state=NORMAL)
@@ -667,102 +763,106 @@ class MedicalDictationApp(ttk.Window):
         if self.listening and self.stop_listening_function:
             self.stop_listening_function(wait_for_stop=False)
             self.listening = False
-            self.update_status("Idle")
+            logging.info(f"Transcription engines: {self.transcriber.supervisor.summary()}")
+            logging.info(f"Dictation chunks: {self.chunk_stats.summary()}")
+            if self.dictation_pipeline.merged_chunks:
+                logging.info(f"Dictation queue overflowed; {self.dictation_pipeline.merged_chunks} phrases were merged")
+            self.update_status(f"Idle. {self.vad.summary()}" if SETTINGS.get("vad_enabled", True) else "Idle")
             self.record_button.config(state=NORMAL)
             self.stop_button.config(state=DISABLED)
 
-    def callback(self, recognizer: sr.Recognizer, audio: sr.AudioData) -> None:
-        self.executor.submit(self.process_audio, recognizer, audio)
-
-    def _combine_audio_segments(self, segments: list) -> AudioSegment:
-        # Combine list of audio segments into one
-        if not segments:
-            return None
-        combined = segments[0]
-        for seg in segments[1:]:
-            combined += seg
-        return combined
-
-    def _transcribe_audio(self, segment: AudioSegment) -> str:
+    def _start_streaming_dictation(self, mic: sr.Microphone) -> bool:
+        client = DeepgramStreamingClient(
+            self.deepgram_api_key,
+            on_transcript=lambda text, is_final: self.after(0, self._handle_stream_transcript, text, is_final),
+            sample_rate=mic.SAMPLE_RATE,
+            url=SETTINGS.get("deepgram_streaming_url", DEEPGRAM_LIVE_URL),
+            language=self.recognition_language,
+            on_error=lambda e: self.after(0, self.update_status, f"Streaming error: {e}", "error")
+        )
         try:
-            if self.deepgram_client:
-                buf = BytesIO()
-                segment.export(buf, format="wav")
-                buf.seek(0)
-                options = PrerecordedOptions(model="nova-2-medical", language="en-US")
-                try:
-                    response = self.deepgram_client.listen.rest.v("1").transcribe_file({"buffer": buf}, options)
-                    transcript = json.loads(response.to_json(indent=4))["results"]["channels"][0]["alternatives"][0]["transcript"]
-                    return transcript
-                except Exception as e:
-                    logging.error("Deepgram API timeout, falling back to Google Speech Recognition", exc_info=True)
-                    self.update_status(f"Deepgram API timeout: {str(e)}")
-                    temp_file = "temp.wav"
-                    segment.export(temp_file, format="wav")
-                    with sr.AudioFile(temp_file) as source:
-                        audio_data = self.recognizer.record(source)
-                    transcript = self.recognizer.recognize_google(audio_data, language=self.recognition_language)
-                    os.remove(temp_file)
-                    return transcript
-            else:
-                temp_file = "temp.wav"
-                segment.export(temp_file, format="wav")
-                with sr.AudioFile(temp_file) as source:
-                    audio_data = self.recognizer.record(source)
-                transcript = self.recognizer.recognize_google(audio_data, language=self.recognition_language)
-                os.remove(temp_file)
-                return transcript
+            client.connect()
         except Exception as e:
-            logging.error("Transcription error", exc_info=True)
-            self.update_status(f"Transcription error: {str(e)}")
-            return ""
+            logging.error("Error connecting to Deepgram streaming endpoint", exc_info=True)
+            self.update_status(f"Streaming connection failed: {e}", status_type="error")
+            return False
+
+        def buffer_frames(data: bytes) -> None:
+            self.audio_buffer.append(AudioSegment(data=data, sample_width=mic.SAMPLE_WIDTH, frame_rate=mic.SAMPLE_RATE, channels=1))
+
+        self.stop_listening_function = stream_microphone(mic, client, on_frames=buffer_frames)
+        return True
+
+    def _handle_stream_transcript(self, text: str, is_final: bool) -> None:
+        # Interim results are shown greyed out at the end of the text and replaced as they are revised
+        for widget in [self.transcript_text, self.soap_text, self.referral_text, self.dictation_text]:
+            ranges = widget.tag_ranges("interim")
+            if ranges:
+                widget.delete(ranges[0], ranges[1])
+        if is_final:
+            self.handle_recognized_text(text)
+            return
+        active_widget = self.get_active_text_widget()
+        current = active_widget.get("1.0", "end-1c")
+        active_widget.tag_config("interim", foreground="gray")
+        active_widget.insert(tk.END, (" " if current and current[-1] not in " \n" else "") + text, "interim")
+        active_widget.see(tk.END)
 
-    # Refactor process_audio using the new helper
-    def process_audio(self, recognizer: sr.Recognizer, audio: sr.AudioData) -> None:
+    def callback(self, recognizer: sr.Recognizer, audio: sr.AudioData) -> None:
         try:
-            channels = getattr(audio, "channels", 1)
-            segment = AudioSegment(
-                data=audio.get_raw_data(),
-                sample_width=audio.sample_width,
-                frame_rate=audio.sample_rate,
-                channels=channels
-            )
-            self.audio_segments.append(segment)
-            transcript = self._transcribe_audio(segment)
-            self.after(0, self.handle_recognized_text, transcript)
-        except sr.UnknownValueError:
-            logging.info("Audio not understood.")
-            self.after(0, self.update_status, "Audio not understood")
-        except sr.RequestError as e:
-            logging.error("Request error", exc_info=True)
-            self.after(0, self.update_status, f"Request error: {e}")
+            segment = self._audio_to_segment(audio)
         except Exception as e:
             logging.error("Processing error", exc_info=True)
             self.after(0, self.update_status, f"Error: {e}")
+            return
+        self.audio_buffer.append(segment)
+        self.dictation_pipeline.submit(segment)
 
-    # Refactor process_soap_recording to use helpers
-    def process_soap_recording(self) -> None:
-        def task() -> None:
-            try:
-                combined = self._combine_audio_segments(self.soap_audio_segments)
-                transcript = self._transcribe_audio(combined) if combined else ""
-                soap_note = create_soap_note_with_openai(transcript)
-            except Exception as e:
-                soap_note = f"Error processing SOAP note: {e}"
-                transcript = ""
-            def update_ui():
-                self.transcript_text.delete("1.0", tk.END)
-                self.transcript_text.insert(tk.END, transcript)
-                self._update_text_area(soap_note, "SOAP note created from recording.", self.record_soap_button, self.soap_text)
-                self.notebook.select(1)
-            self.after(0, update_ui)
-        self.executor.submit(task)
+    def _show_queue_depth(self, queued: int, in_flight: int) -> None:
+        if not queued and not in_flight:
+            self.queue_indicator.config(text="", foreground="gray")
+            return
+        # Turn the indicator orange once phrases are waiting for a free worker
+        color = "orange" if queued else "gray"
+        self.queue_indicator.config(text=f"Queue: {queued} waiting, {in_flight} transcribing", foreground=color)
+
+    def _audio_to_segment(self, audio: sr.AudioData) -> AudioSegment:
+        channels = getattr(audio, "channels", 1)
+        if SETTINGS.get("normalize_capture", True):
+            # Everything downstream (buffers, VAD, cache keys, uploads) then works on 16 kHz mono
+            return normalize_capture(audio.get_raw_data(), audio.sample_width, audio.sample_rate, channels)
+        return AudioSegment(
+            data=audio.get_raw_data(),
+            sample_width=audio.sample_width,
+            frame_rate=audio.sample_rate,
+            channels=channels
+        )
+
+    def _transcribe_speech(self, segment: AudioSegment, task: str = "dictation") -> str:
+        # Drop non-speech frames first; chunks with no speech at all are never uploaded
+        if SETTINGS.get("vad_enabled", True):
+            segment = self.vad.trim(segment)
+            if segment is None:
+                return ""
+        return self._transcribe_audio(segment, task)
+
+    def _transcribe_audio(self, segment: AudioSegment, task: str = "dictation") -> str:
+        # Engine choice per task, failover, hedging and caching are handled by the Transcriber
+        try:
+            return self.transcriber.transcribe(segment, task)
+        except Exception as e:
+            logging.error("Transcription error", exc_info=True)
+            self.update_status(f"Transcription error: {str(e)}")
+            return ""
+
+    def _on_engine_failover(self, engine, error: Exception) -> None:
+        self.after(0, self.update_status, f"{ENGINE_DISPLAY_NAMES[engine.name]} error: {str(error)}")
 
     # Refactor load_audio_file to use the transcription helper
     def load_audio_file(self) -> None:
         file_path = filedialog.askopenfilename(
             title="Select Audio File",
-            filetypes=[("Audio Files", "*.wav *.mp3"), ("All Files", "*.*")]
+            filetypes=[("Audio Files", "*.wav *.mp3 *.m4a *.ogg *.opus *.webm *.flac *.aac *.mp4"), ("All Files", "*.*")]
         )
         if not file_path:
             return
@@ -773,13 +873,7 @@ class MedicalDictationApp(ttk.Window):
         def task() -> None:
             transcript = ""
             try:
-                if file_path.lower().endswith(".mp3"):
-                    seg = AudioSegment.from_file(file_path, format="mp3")
-                elif file_path.lower().endswith(".wav"):
-                    seg = AudioSegment.from_file(file_path, format="wav")
-                else:
-                    raise ValueError("Unsupported audio format.")
-                transcript = self._transcribe_audio(seg)
+                transcript = self._transcribe_audio_file(file_path)
             except Exception as e:
                 logging.error("Error transcribing audio", exc_info=True)
                 self.after(0, lambda: messagebox.showerror("Transcription Error", f"Error: {e}"))
@@ -791,9 +885,23 @@ class MedicalDictationApp(ttk.Window):
             finally:
                 self.after(0, lambda: self.load_button.config(state=NORMAL))
                 self.after(0, self.progress_bar.stop)
+                self.after(0, lambda: self.progress_bar.config(mode="indeterminate", value=0))
                 self.after(0, self.progress_bar.pack_forget)
         self.executor.submit(task)
 
+    def _transcribe_audio_file(self, file_path: str) -> str:
+        return transcribe_file(
+            file_path, lambda window: self._transcribe_audio(window, "import"),
+            chunk_seconds=SETTINGS.get("import_chunk_seconds", 60),
+            max_workers=SETTINGS.get("import_max_concurrency", 4),
+            on_progress=lambda done, total: self.after(0, self._show_chunk_progress, done, total)
+        )
+
+    def _show_chunk_progress(self, done: int, total: int) -> None:
+        self.progress_bar.stop()
+        self.progress_bar.config(mode="determinate", maximum=total, value=done)
+        self.update_status(f"Transcribing audio... chunk {done}/{total}", status_type="progress")
+
     def append_text_to_widget(self, text: str, widget: tk.Widget) -> None:
         current = widget.get("1.0", "end-1c")
         if (self.capitalize_next or not current or current[-1] in ".!?") and text:
@@ -833,27 +941,142 @@ class MedicalDictationApp(ttk.Window):
         else:
             self.append_text_to_widget(text, active_widget)
 
-    def _process_text_with_ai(self, api_func: Callable[[str], str], success_message: str, button: ttk.Button, target_widget: tk.Widget) -> None:
+    def _process_text_with_ai(self, api_func: Callable[[str], str], success_message: str, button: ttk.Button, target_widget: tk.Widget,
+                              stream_func: Callable = None, paragraphs: ParagraphProcessor = None) -> None:
         text = target_widget.get("1.0", tk.END).strip()
         if not text:
             messagebox.showwarning("Process Text", "There is no text to process.")
             return
+        remember = None
+        if paragraphs and SETTINGS.get("paragraph_ai_processing", True):
+            plan = paragraphs.plan(text)
+            pending = [segment for segment, todo in plan if todo]
+            if not pending:
+                self.update_status("Nothing changed since the last run.", status_type="info")
+                return
+            remember = paragraphs.remember_text
+            # Only changed paragraphs are sent, concurrently; when every paragraph is new the whole text
+            # goes out as one request, which can stream
+            all_pending = all(todo for segment, todo in plan if segment.strip())
+            if not all_pending or not stream_func or not SETTINGS.get("stream_ai_responses", True):
+                self.update_status(f"Processing {len(pending)} changed paragraph(s)...")
+                button.config(state=DISABLED)
+                self.progress_bar.pack(side=RIGHT, padx=10)
+                self.progress_bar.start()
+
+                def paragraph_task() -> None:
+                    result, failed = paragraphs.run(plan)
+                    if failed == len(pending):
+                        message = f"Error processing text: none of the {len(pending)} changed paragraph(s) could be processed."
+                        self.after(0, lambda: self._finish_text_task(message, button, status_type="error"))
+                    elif failed:
+                        message = f"Processed {len(pending) - failed} of {len(pending)} changed paragraph(s); {failed} failed and will be retried."
+                        self.after(0, lambda: self._update_text_area(result, message, button, target_widget, status_type="warning"))
+                    else:
+                        self.after(0, lambda: self._update_text_area(result, success_message, button, target_widget))
+                self.executor.submit(paragraph_task)
+                return
         self.update_status("Processing text...")
         button.config(state=DISABLED)
         self.progress_bar.pack(side=RIGHT, padx=10)
         self.progress_bar.start()
 
+        if stream_func and SETTINGS.get("stream_ai_responses", True):
+            self._stream_text_with_ai(lambda: stream_func(text), StreamCleaner(markdown=False), remove_think,
+                                      success_message, button, target_widget, on_result=remember)
+            return
+
         def task() -> None:
             result = api_func(text)
             self.after(0, lambda: self._update_text_area(result, success_message, button, target_widget))
         self.executor.submit(task)
 
-    def _update_text_area(self, new_text: str, success_message: str, button: ttk.Button, target_widget: tk.Widget) -> None:
+    def _stream_text_with_ai(self, stream: Callable, cleaner: StreamCleaner, finalize: Callable[[str], str],
+                             success_message: str, button: ttk.Button, target_widget: tk.Widget,
+                             on_result: Callable[[str], None] = None) -> None:
+        """Show a streamed completion in ``target_widget`` as it is generated.
+
+        Cleaned pieces are collected on the worker thread and inserted at most once
+        per Tk frame. When the stream ends the widget is set to ``finalize(raw text)``
+        if the incremental view differs from it. If the stream fails, even part way,
+        the widget's original text is put back and ``on_result`` is not called.
+        """
+        original = target_widget.get("1.0", "end-1c")
+        pieces = []
+        lock = threading.Lock()
+        state = {"scheduled": False, "started": False, "failed": False}
+
+        def flush() -> None:
+            with lock:
+                text = "".join(pieces)
+                pieces.clear()
+                state["scheduled"] = False
+                if state["failed"]:
+                    return
+            if not text:
+                return
+            if not state["started"]:
+                state["started"] = True
+                target_widget.edit_separator()
+                target_widget.delete("1.0", tk.END)
+            target_widget.insert(tk.END, text)
+            target_widget.see(tk.END)
+
+        def push(text: str) -> None:
+            if not text:
+                return
+            with lock:
+                pieces.append(text)
+                if state["scheduled"]:
+                    return
+                state["scheduled"] = True
+            self.after(16, flush)
+
+        def done(result: str) -> None:
+            flush()
+            if on_result:
+                on_result(result)
+            if target_widget.get("1.0", "end-1c") != result:
+                self._update_text_area(result, success_message, button, target_widget)
+            else:
+                target_widget.edit_separator()
+                self._finish_text_task(success_message, button)
+
+        def fail(error: Exception) -> None:
+            with lock:
+                state["failed"] = True
+                pieces.clear()
+            if state["started"]:
+                # Never leave a fragment of a response in place of the original text
+                target_widget.delete("1.0", tk.END)
+                target_widget.insert(tk.END, original)
+                target_widget.edit_separator()
+            self._finish_text_task(f"Error processing text: {error}", button, status_type="error")
+
+        def task() -> None:
+            raw = []
+            try:
+                for delta in stream():
+                    raw.append(delta)
+                    push(cleaner.feed(delta))
+                push(cleaner.finish())
+            except Exception as e:
+                logging.error("Error streaming AI response", exc_info=True)
+                self.after(0, fail, e)
+                return
+            self.after(0, done, finalize("".join(raw)))
+        self.executor.submit(task)
+
+    def _update_text_area(self, new_text: str, success_message: str, button: ttk.Button, target_widget: tk.Widget,
+                          status_type: str = "success") -> None:
         target_widget.edit_separator()
         target_widget.delete("1.0", tk.END)
         target_widget.insert(tk.END, new_text)
         target_widget.edit_separator()
-        self.update_status(success_message, status_type="success")
+        self._finish_text_task(success_message, button, status_type=status_type)
+
+    def _finish_text_task(self, message: str, button: ttk.Button, status_type: str = "success") -> None:
+        self.update_status(message, status_type=status_type)
         button.config(state=NORMAL)
         self.progress_bar.stop()
         self.progress_bar.pack_forget()
@@ -863,11 +1086,13 @@ class MedicalDictationApp(ttk.Window):
 
     def refine_text(self) -> None:
         active_widget = self.get_active_text_widget()
-        self._process_text_with_ai(adjust_text_with_openai, "Text refined.", self.refine_button, active_widget)
+        self._process_text_with_ai(adjust_text_with_openai, "Text refined.", self.refine_button, active_widget,
+                                   stream_func=adjust_text_stream, paragraphs=self.refine_paragraphs)
 
     def improve_text(self) -> None:
         active_widget = self.get_active_text_widget()
-        self._process_text_with_ai(improve_text_with_openai, "Text improved.", self.improve_button, active_widget)
+        self._process_text_with_ai(improve_text_with_openai, "Text improved.", self.improve_button, active_widget,
+                                   stream_func=improve_text_stream, paragraphs=self.improve_paragraphs)
 
     def create_soap_note(self) -> None:
         transcript = self.transcript_text.get("1.0", tk.END).strip()
@@ -878,11 +1103,19 @@ class MedicalDictationApp(ttk.Window):
         self.soap_button.config(state=DISABLED)
         self.progress_bar.pack(side=RIGHT, padx=10)
         self.progress_bar.start()
+        if SETTINGS.get("stream_ai_responses", True):
+            # Show the note as it is written
+            self.notebook.select(1)
+            self._stream_text_with_ai(lambda: create_soap_note_stream(transcript), StreamCleaner(citations=True),
+                                      clean_soap_note, "SOAP note created.", self.soap_button, self.soap_text,
+                                      on_result=lambda result: self._speculate_referral())
+            return
         def task() -> None:
             result = create_soap_note_with_openai(transcript)
             self.after(0, lambda: [
                 self._update_text_area(result, "SOAP note created.", self.soap_button, self.soap_text),
-                self.notebook.select(1)  # Switch focus to SOAP Note tab (index 1)
+                self.notebook.select(1),  # Switch focus to SOAP Note tab (index 1)
+                self._speculate_referral()
             ])
         self.executor.submit(task)
 
@@ -891,10 +1124,49 @@ class MedicalDictationApp(ttk.Window):
         prompt = ("Extract up to a maximun of 5 relevant medical conditions for a referral from the following text. Keep the condition names simple and specific and not longer that 3 words. "
                   "Return them as a comma-separated list. Text: " + text)
         result = call_ai("gpt-4o", "You are a physician specialized in referrals.", prompt, 0.7, 100)
+        # call_ai returns the prompt when the request fails; raise so the prefetched result is retried
+        if result == prompt or not result.strip():
+            raise RuntimeError("the AI provider did not return any conditions")
         conditions = remove_markdown(result).strip()
         conditions = remove_citations(conditions)
         return conditions
 
+    def _referral_future(self, kind: str, text: str, focus: str = "") -> concurrent.futures.Future:
+        """Return the shared future for a referral step on ``text``, starting it if needed.
+
+        Futures are kept per hash of the text, so work started speculatively is
+        reused by the Referral button. Work for older text is forgotten but not
+        cancelled, since a Referral click may still be waiting on it, and work
+        that failed is started again.
+        """
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        key = (kind, text_hash, focus)
+        with self.referral_prefetch_lock:
+            for old_key in [k for k in self.referral_prefetch if k[1] != text_hash]:
+                del self.referral_prefetch[old_key]
+            future = self.referral_prefetch.get(key)
+            if future is None or (future.done() and future.exception() is not None):
+                if kind == "conditions":
+                    future = self.executor.submit(self._get_possible_conditions, text)
+                else:
+                    from ai import create_referral_with_openai
+                    future = self.executor.submit(create_referral_with_openai, text, focus)
+                self.referral_prefetch[key] = future
+            return future
+
+    def _forget_referral_future(self, future: concurrent.futures.Future) -> None:
+        with self.referral_prefetch_lock:
+            for key in [k for k, f in self.referral_prefetch.items() if f is future]:
+                del self.referral_prefetch[key]
+
+    def _speculate_referral(self) -> None:
+        # Start extracting referral conditions as soon as a SOAP note exists, before Referral is clicked
+        if not SETTINGS.get("speculative_referral", True):
+            return
+        text = self.transcript_text.get("1.0", tk.END).strip()
+        if text:
+            self._referral_future("conditions", text)
+
     def create_referral(self) -> None:
         # New: Immediately update status and display progress bar on referral click
         self.update_status("Referral button clicked - preparing referral...")
@@ -902,14 +1174,13 @@ class MedicalDictationApp(ttk.Window):
         self.progress_bar.start()
         
         text = self.transcript_text.get("1.0", tk.END).strip()
-        # New: Get suggested conditions asynchronously
-        def get_conditions() -> str:
-            return self._get_possible_conditions(text)
-        future = self.executor.submit(get_conditions)
+        # Suggested conditions, usually already extracted when the SOAP note was created
+        future = self._referral_future("conditions", text)
         def on_conditions_done(future_result):
             try:
                 suggestions = future_result.result() or ""
-            except Exception as e:
+            except (Exception, concurrent.futures.CancelledError) as e:
+                logging.error(f"Error extracting referral conditions: {str(e)}")
                 suggestions = ""
             # Continue on the main thread
             self.after(0, lambda: self._create_referral_continued(suggestions))
@@ -919,39 +1190,38 @@ class MedicalDictationApp(ttk.Window):
         self.progress_bar.stop()
         self.progress_bar.pack_forget()
         conditions_list = [cond.strip() for cond in suggestions.split(",") if cond.strip()]
+        transcript = self.transcript_text.get("1.0", tk.END).strip()
+        if SETTINGS.get("speculative_referral", True):
+            # Write the general referral while the user is choosing; it is used if no condition is selected
+            self._referral_future("referral", transcript)
         # Fix: Use ask_conditions_dialog as an imported function, not as a method
         from dialogs import ask_conditions_dialog
         focus = ask_conditions_dialog(self, "Select Conditions", "Select conditions to focus on:", conditions_list)
-        if not focus:
-            self.update_status("Referral cancelled or no conditions selected.", status_type="warning")
+        if focus is None:
+            self.update_status("Referral cancelled.", status_type="warning")
             return
+        label = focus or "general referral"
         
         # Use "progress" status type to prevent auto-clearing for long-running operations
-        self.update_status(f"Processing referral for conditions: {focus}...", status_type="progress")
+        self.update_status(f"Processing referral for conditions: {label}...", status_type="progress")
         self.progress_bar.pack(side=RIGHT, padx=10)
         self.progress_bar.start()
         self.referral_button.config(state=DISABLED)  # Disable button while processing
-        
-        def task() -> None:
+        self.schedule_status_update(3000, f"Still generating referral for: {label}...", "progress")
+        self.schedule_status_update(10000, f"Processing referral (this may take a moment)...", "progress")
+
+        def on_referral_done(future_result) -> None:
+            # A delivered referral is not reused; clicking Referral again writes a new one
+            self._forget_referral_future(future_result)
             try:
-                transcript = self.transcript_text.get("1.0", tk.END).strip()
-                # Import locally to avoid potential circular imports
-                from ai import create_referral_with_openai
-                
-                # Use our custom scheduler instead of direct after() calls
-                self.schedule_status_update(3000, f"Still generating referral for: {focus}...", "progress")
-                self.schedule_status_update(10000, f"Processing referral (this may take a moment)...", "progress")
-                
-                # Execute the referral creation with conditions
-                result = create_referral_with_openai(transcript, focus)
-                
+                result = future_result.result()
                 # Update UI when done
                 self.after(0, lambda: [
-                    self._update_text_area(result, f"Referral created for: {focus}", self.referral_button, self.referral_text),
+                    self._update_text_area(result, f"Referral created for: {label}", self.referral_button, self.referral_text),
                     self.notebook.select(2)  # Switch focus to Referral tab (index 2)
                 ])
-            except Exception as e:
-                error_msg = f"Error creating referral: {str(e)}"
+            except (Exception, concurrent.futures.CancelledError) as e:
+                error_msg = f"Error creating referral: {str(e) or type(e).__name__}"
                 logging.error(error_msg, exc_info=True)
                 self.after(0, lambda: [
                     self.update_status(error_msg, status_type="error"),
@@ -959,18 +1229,37 @@ class MedicalDictationApp(ttk.Window):
                     self.progress_bar.stop(),
                     self.progress_bar.pack_forget()
                 ])
-        
-        # Execute in thread pool
-        self.executor.submit(task)
+
+        # The general referral has normally been prefetched while the dialog was open
+        self._referral_future("referral", transcript, focus).add_done_callback(on_referral_done)
 
     def refresh_microphones(self) -> None:
-        names = get_valid_microphones() or sr.Microphone.list_microphone_names()
+        self.update_status("Refreshing microphone list...")
+        self.mic_refresh_requested = True
+        self.mic_registry.refresh()
+
+    def _update_microphones(self, devices: list) -> None:
+        # Keep the current selection if that device is still present
+        previous = self.mic_combobox.get()
+        self.mic_devices = devices
+        names = [name for _, name in devices]
         self.mic_combobox['values'] = names
-        if names:
+        if previous in names:
+            self.mic_combobox.current(names.index(previous))
+        elif names:
             self.mic_combobox.current(0)
         else:
             self.mic_combobox.set("No microphone found")
-        self.update_status("Microphone list refreshed.")
+        if self.mic_refresh_requested:
+            self.mic_refresh_requested = False
+            self.update_status("Microphone list refreshed.")
+
+    def _selected_device_index(self) -> Optional[int]:
+        # Combobox positions index the filtered list; map them back to the PortAudio device index
+        position = self.mic_combobox.current()
+        if 0 <= position < len(self.mic_devices):
+            return self.mic_devices[position][0]
+        return None
 
     def toggle_soap_recording(self) -> None:
         if not self.soap_recording:
@@ -980,46 +1269,44 @@ class MedicalDictationApp(ttk.Window):
             self.referral_text.delete("1.0", tk.END)   # NEW: clear referral tab
             self.dictation_text.delete("1.0", tk.END)   # NEW: clear dictation tab
             self.appended_chunks.clear()
-            self.soap_audio_segments.clear()
+            self.soap_audio_buffer.clear()
+            self.soap_transcriber.reset()
+            self.vad.reset_stats()
+            self.chunk_stats.reset()
+            # Transcribe chunks while the visit is still going unless disabled in settings
+            self.soap_incremental = SETTINGS.get("incremental_soap_transcription", True)
             self.soap_recording = True
             self.soap_paused = False  # NEW: reset pause state
             self.record_soap_button.config(text="Stop", bootstyle="danger")
             self.pause_soap_button.config(state=tk.NORMAL, text="Pause")  # enable pause button
             self.update_status("Recording SOAP note...")
+            # The recording is written to its dated WAV file as it is captured
+            import datetime
+            folder = SETTINGS.get("default_storage_folder")
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            now_str = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M")
+            audio_file_path = os.path.join(folder, f"{now_str}.wav") if folder else f"{now_str}.wav"
+            self.soap_wav_writer = WavAppendWriter(audio_file_path)
             try:
                 import speech_recognition as sr
-                selected_index = self.mic_combobox.current()
-                mic = sr.Microphone(device_index=selected_index)
+                mic = sr.Microphone(device_index=self._selected_device_index())
             except Exception as e:
                 logging.error("Error creating microphone for SOAP recording", exc_info=True)
                 self.update_status("Error accessing microphone for SOAP note.")
                 return
-            self.soap_stop_listening_function = self.recognizer.listen_in_background(mic, self.soap_callback, phrase_time_limit=10)
+            self.soap_stop_listening_function = listen_adaptive(self.recognizer, mic, self.soap_callback, SETTINGS, self.chunk_stats)
         else:
-            # Stopping SOAP recording
-            if self.soap_stop_listening_function:
-                self.soap_stop_listening_function(wait_for_stop=False)
+            # Stopping SOAP recording; the capture thread is joined in the background (see process_soap_recording)
             self.soap_recording = False
             self.soap_paused = False
             # Disable the record SOAP note button for 5 seconds to prevent double click
             self.record_soap_button.config(text="Record SOAP Note", bootstyle="SECONDARY", state=tk.DISABLED)
             self.pause_soap_button.config(state=tk.DISABLED, text="Pause")
             self.update_status("Transcribing SOAP note...")
-            import datetime
-            folder = SETTINGS.get("default_storage_folder")
-            if folder and not os.path.exists(folder):
-                os.makedirs(folder)
-            now_str = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M")
-            audio_file_path = os.path.join(folder, f"{now_str}.wav") if folder else f"{now_str}.wav"
-            if self.soap_audio_segments:
-                combined = self.soap_audio_segments[0]
-                for seg in self.soap_audio_segments[1:]:
-                    combined += seg
-                combined.export(audio_file_path, format="wav")
-                self.update_status(f"SOAP audio saved to: {audio_file_path}")
             self.progress_bar.pack(side=RIGHT, padx=10)
             self.progress_bar.start()
-            self.process_soap_recording()
+            self.process_soap_recording(self.soap_stop_listening_function)
             # Re-enable the record button after 5 seconds
             self.after(5000, lambda: self.record_soap_button.config(state=NORMAL))
 
@@ -1040,36 +1327,56 @@ class MedicalDictationApp(ttk.Window):
     def resume_soap_recording(self) -> None:
         if self.soap_recording and self.soap_paused:
             try:
-                mic = sr.Microphone()  # Adjust as needed for selected mic
+                mic = sr.Microphone(device_index=self._selected_device_index())
             except Exception as e:
                 self.update_status(f"Error accessing microphone: {e}")
                 return
-            self.soap_stop_listening_function = self.recognizer.listen_in_background(mic, self.soap_callback, phrase_time_limit=10)
+            self.soap_stop_listening_function = listen_adaptive(self.recognizer, mic, self.soap_callback, SETTINGS, self.chunk_stats)
             self.soap_paused = False
             self.pause_soap_button.config(text="Pause")
             self.update_status("SOAP note recording resumed.")
 
     def soap_callback(self, recognizer: sr.Recognizer, audio: sr.AudioData) -> None:
         try:
-            channels = getattr(audio, "channels", 1)
-            segment = AudioSegment(
-                data=audio.get_raw_data(),
-                sample_width=audio.sample_width,
-                frame_rate=audio.sample_rate,
-                channels=channels
-            )
-            self.soap_audio_segments.append(segment)
+            segment = self._audio_to_segment(audio)
+            self.soap_audio_buffer.append(segment)
+            if self.soap_wav_writer:
+                self.soap_wav_writer.append(segment)
+            if self.soap_incremental:
+                self.soap_transcriber.submit(segment)
         except Exception as e:
             logging.error("Error recording SOAP note chunk", exc_info=True)
 
-    def process_soap_recording(self) -> None:
+    def _show_running_soap_transcript(self) -> None:
+        # Only mirror partial results while recording; the final transcript is set by process_soap_recording
+        if not self.soap_recording:
+            return
+        self.transcript_text.delete("1.0", tk.END)
+        self.transcript_text.insert(tk.END, self.soap_transcriber.running_transcript())
+        self.transcript_text.see(tk.END)
+
+    def process_soap_recording(self, stop_capture: Callable[..., None] = None) -> None:
+        writer = self.soap_wav_writer
+
         def task() -> None:
+            if stop_capture:
+                # Waiting lets the chunker hand over the phrase in progress without blocking the Tk thread
+                stop_capture(wait_for_stop=True)
+            logging.info(f"SOAP recording chunks: {self.chunk_stats.summary()}")
+            if writer:
+                # Audio is already on disk; closing only finalizes the header
+                writer.close()
+                if writer.has_audio:
+                    self.after(0, lambda: self.update_status(f"SOAP audio saved to: {writer.path}"))
             try:
-                if not self.soap_audio_segments:
+                if not self.soap_audio_buffer:
                     transcript = ""
+                elif self.soap_incremental:
+                    # Chunks were transcribed while recording; only the ones still in flight are waited on
+                    transcript = self.soap_transcriber.finish()
                 else:
-                    combined = self._combine_audio_segments(self.soap_audio_segments)
-                    transcript = self._transcribe_audio(combined) if combined else ""
+                    combined = self.soap_audio_buffer.to_segment()
+                    transcript = self._transcribe_speech(combined, "soap_note") if combined else ""
                 soap_note = create_soap_note_with_openai(transcript)
             except Exception as e:
                 soap_note = f"Error processing SOAP note: {e}"
@@ -1079,9 +1386,14 @@ class MedicalDictationApp(ttk.Window):
                 self.transcript_text.delete("1.0", tk.END)
                 self.transcript_text.insert(tk.END, transcript)
                 # Update SOAP Note tab with the generated SOAP note
-                self._update_text_area(soap_note, "SOAP note created from recording.", self.record_soap_button, self.soap_text)
+                message = "SOAP note created from recording."
+                if SETTINGS.get("vad_enabled", True):
+                    message += f" {self.vad.summary()}"
+                self._update_text_area(soap_note, message, self.record_soap_button, self.soap_text)
                 # Switch focus to the SOAP Note tab (index 1)
                 self.notebook.select(1)
+                if transcript:
+                    self._speculate_referral()
             self.after(0, update_ui)
         self.executor.submit(task)
 
@@ -1103,7 +1415,14 @@ class MedicalDictationApp(ttk.Window):
 
     def on_closing(self) -> None:
         try:
+            self.mic_registry.stop()
+            self.dictation_pipeline.shutdown()
+            self.transcriber.shutdown()
             self.executor.shutdown(wait=False)
+            self.audio_buffer.close()
+            self.soap_audio_buffer.close()
+            if self.soap_wav_writer:
+                self.soap_wav_writer.close()
         except Exception as e:
             logging.error("Error shutting down executor", exc_info=True)
         self.destroy()
@@ -0,0 +1,494 @@
+import os
+import mmap
+import struct
+import hashlib
+import wave
+import tempfile
+import subprocess
+import threading
+from io import BytesIO
+import numpy as np
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple, Union
+from pydub import AudioSegment
+from pydub.silence import detect_silence
+from pydub.utils import mediainfo
+
+UPLOAD_SAMPLE_RATE = 16000
+
+# Export arguments and MIME type for each supported upload codec
+UPLOAD_CODECS = {
+    "wav": ({"format": "wav"}, "audio/wav"),
+    "flac": ({"format": "flac"}, "audio/flac"),
+    "opus": ({"format": "ogg", "codec": "libopus", "bitrate": "24k"}, "audio/ogg"),
+}
+
+
+def encode_for_upload(segment: AudioSegment, codec: str = "flac") -> Tuple[bytes, str]:
+    """Downmix to mono, resample to 16 kHz and encode ``segment`` for upload.
+
+    Returns the encoded bytes and their MIME type. Unknown codecs fall back to WAV.
+    """
+    export_args, mimetype = UPLOAD_CODECS.get(codec, UPLOAD_CODECS["wav"])
+    if segment.channels != 1:
+        segment = segment.set_channels(1)
+    if segment.frame_rate > UPLOAD_SAMPLE_RATE:
+        segment = segment.set_frame_rate(UPLOAD_SAMPLE_RATE)
+    if segment.sample_width != 2:
+        segment = segment.set_sample_width(2)
+    buf = BytesIO()
+    segment.export(buf, **export_args)
+    return buf.getvalue(), mimetype
+
+
+def audio_fingerprint(segment: AudioSegment) -> str:
+    """SHA-256 of the segment's PCM after normalizing to 16 kHz mono 16-bit.
+
+    The same recording hashes the same whatever rate or channel layout it was
+    captured or decoded at, which makes it usable as a content-addressed cache key.
+    """
+    if segment.channels != 1:
+        segment = segment.set_channels(1)
+    if segment.frame_rate != UPLOAD_SAMPLE_RATE:
+        segment = segment.set_frame_rate(UPLOAD_SAMPLE_RATE)
+    if segment.sample_width != 2:
+        segment = segment.set_sample_width(2)
+    return hashlib.sha256(segment.raw_data).hexdigest()
+
+
+# NumPy sample type for each PCM sample width in bytes (8-bit PCM is unsigned)
+PCM_DTYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+
+def _lowpass_taps(cutoff: float, num_taps: int = 63) -> np.ndarray:
+    """Hamming-windowed sinc low-pass filter; ``cutoff`` is a fraction of the input sample rate."""
+    n = np.arange(num_taps) - (num_taps - 1) / 2.0
+    taps = np.sinc(2.0 * cutoff * n) * np.hamming(num_taps)
+    return (taps / taps.sum()).astype(np.float32)
+
+
+def normalize_capture(data: bytes, sample_width: int, sample_rate: int, channels: int = 1,
+                      target_rate: int = UPLOAD_SAMPLE_RATE, peak_dbfs: float = -1.0,
+                      max_gain_db: float = 6.0) -> AudioSegment:
+    """Convert captured PCM to mono 16-bit ``target_rate`` audio in one vectorized pass.
+
+    Channels are averaged, the signal is low-pass filtered and linearly
+    resampled, and the peak is brought to ``peak_dbfs``. Boost is capped at
+    ``max_gain_db`` so quiet room noise stays below the VAD threshold; loud
+    chunks are always attenuated enough not to clip.
+    """
+    if sample_width not in PCM_DTYPES:
+        segment = AudioSegment(data=data, sample_width=sample_width, frame_rate=sample_rate, channels=channels)
+        return conform_segment(segment, 2, target_rate, 1)
+    samples = np.frombuffer(data, dtype=PCM_DTYPES[sample_width]).astype(np.float32)
+    if sample_width == 1:
+        samples -= 128.0
+    samples /= float(2 ** (8 * sample_width - 1))
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+
+    if sample_rate != target_rate and len(samples):
+        if sample_rate > target_rate:
+            # Remove content above the new Nyquist frequency before decimating to avoid aliasing
+            samples = np.convolve(samples, _lowpass_taps(0.45 * target_rate / sample_rate), mode="same")
+        n_out = int(round(len(samples) * target_rate / sample_rate))
+        positions = np.arange(n_out, dtype=np.float64) * (sample_rate / target_rate)
+        samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+    peak = float(np.max(np.abs(samples))) if len(samples) else 0.0
+    if peak > 0.0:
+        gain_db = min(peak_dbfs - 20.0 * np.log10(peak), max_gain_db)
+        samples *= 10.0 ** (gain_db / 20.0)
+    pcm = np.clip(np.round(samples * 32768.0), -32768, 32767).astype(np.int16)
+    return AudioSegment(data=pcm.tobytes(), sample_width=2, frame_rate=target_rate, channels=1)
+
+
+def conform_segment(segment: AudioSegment, sample_width: int, frame_rate: int, channels: int) -> AudioSegment:
+    """Convert ``segment`` to the given sample format if it differs."""
+    if (segment.sample_width, segment.frame_rate, segment.channels) != (sample_width, frame_rate, channels):
+        segment = segment.set_sample_width(sample_width).set_frame_rate(frame_rate).set_channels(channels)
+    return segment
+
+
+class AudioBuffer:
+    """Append-only PCM buffer for a recording session.
+
+    Chunks are kept as a list of raw byte strings, so appending is O(1) and the
+    session audio is only assembled once, when it is exported or transcribed.
+    The first appended segment fixes the sample format; later segments that differ
+    (e.g. after resuming on another microphone) are converted to match.
+    """
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+        self._size = 0
+        self._lock = threading.Lock()
+        self.sample_width: Optional[int] = None
+        self.frame_rate: Optional[int] = None
+        self.channels: Optional[int] = None
+
+    def _conform(self, segment: AudioSegment) -> AudioSegment:
+        # Caller holds the lock
+        if self.frame_rate is None:
+            self.sample_width = segment.sample_width
+            self.frame_rate = segment.frame_rate
+            self.channels = segment.channels
+        return conform_segment(segment, self.sample_width, self.frame_rate, self.channels)
+
+    def append(self, segment: AudioSegment) -> None:
+        with self._lock:
+            segment = self._conform(segment)
+            data = segment.raw_data
+            self._chunks.append(data)
+            self._size += len(data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._chunks = []
+            self._size = 0
+            self.sample_width = self.frame_rate = self.channels = None
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    @property
+    def nbytes(self) -> int:
+        return self._size
+
+    @property
+    def duration_seconds(self) -> float:
+        if not self.frame_rate:
+            return 0.0
+        return self._size / float(self.frame_rate * self.sample_width * self.channels)
+
+    def to_segment(self) -> Optional[AudioSegment]:
+        """Return the whole session as a single AudioSegment (one join, no per-chunk copies)."""
+        with self._lock:
+            if not self._chunks:
+                return None
+            data = b"".join(self._chunks)
+            return AudioSegment(data=data, sample_width=self.sample_width,
+                                frame_rate=self.frame_rate, channels=self.channels)
+
+    def write_wav(self, target: Union[str, BinaryIO]) -> None:
+        """Write the session as WAV to a path or file object, streaming chunk by chunk."""
+        with self._lock:
+            chunks = list(self._chunks)
+            params = (self.sample_width, self.frame_rate, self.channels)
+        if not chunks:
+            raise ValueError("Audio buffer is empty.")
+        with wave.open(target, "wb") as wav:
+            wav.setsampwidth(params[0])
+            wav.setframerate(params[1])
+            wav.setnchannels(params[2])
+            for chunk in chunks:
+                wav.writeframesraw(chunk)
+
+    def to_wav_bytes(self) -> bytes:
+        buf = BytesIO()
+        self.write_wav(buf)
+        return buf.getvalue()
+
+
+class SpillAudioStore(AudioBuffer):
+    """Session audio store that spills PCM to a temporary file instead of RAM.
+
+    Chunks are appended to an unnamed temporary file as they arrive and reads go
+    through ``mmap``, so memory use stays flat however long the session runs.
+    It is a drop-in replacement for AudioBuffer.
+    """
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        super().__init__()
+        self._directory = directory
+        self._file = None
+        self._count = 0
+
+    def append(self, segment: AudioSegment) -> None:
+        with self._lock:
+            segment = self._conform(segment)
+            if self._file is None:
+                self._file = tempfile.TemporaryFile(prefix="session-audio-", dir=self._directory)
+            data = segment.raw_data
+            self._file.seek(0, os.SEEK_END)
+            self._file.write(data)
+            self._size += len(data)
+            self._count += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._size = 0
+            self._count = 0
+            self.sample_width = self.frame_rate = self.channels = None
+
+    def close(self) -> None:
+        self.clear()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _map(self) -> Optional[mmap.mmap]:
+        # Caller holds the lock
+        if self._file is None or not self._size:
+            return None
+        self._file.flush()
+        return mmap.mmap(self._file.fileno(), self._size, access=mmap.ACCESS_READ)
+
+    def read(self, offset: int = 0, length: Optional[int] = None) -> bytes:
+        """Return ``length`` bytes of PCM starting at byte ``offset``."""
+        with self._lock:
+            mapped = self._map()
+            if mapped is None:
+                return b""
+            with mapped:
+                end = self._size if length is None else min(self._size, offset + length)
+                return mapped[offset:end]
+
+    def to_segment(self) -> Optional[AudioSegment]:
+        with self._lock:
+            mapped = self._map()
+            if mapped is None:
+                return None
+            with mapped:
+                data = mapped[:]
+            return AudioSegment(data=data, sample_width=self.sample_width,
+                                frame_rate=self.frame_rate, channels=self.channels)
+
+    def write_wav(self, target: Union[str, BinaryIO], block_size: int = 1 << 20) -> None:
+        with self._lock:
+            mapped = self._map()
+            if mapped is None:
+                raise ValueError("Audio buffer is empty.")
+            with mapped, wave.open(target, "wb") as wav:
+                wav.setsampwidth(self.sample_width)
+                wav.setframerate(self.frame_rate)
+                wav.setnchannels(self.channels)
+                for start in range(0, self._size, block_size):
+                    wav.writeframesraw(mapped[start:start + block_size])
+
+
+class WavAppendWriter:
+    """Write a recording to a WAV file chunk by chunk while it is being captured.
+
+    The RIFF and data sizes in the header are patched after every chunk and the
+    file is flushed, so if the app dies mid-recording the file on disk is still
+    a valid WAV holding everything captured so far. ``close`` is therefore cheap.
+    """
+
+    HEADER_SIZE = 44
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file: Optional[BinaryIO] = None
+        self._lock = threading.Lock()
+        self._data_size = 0
+        self.sample_width: Optional[int] = None
+        self.frame_rate: Optional[int] = None
+        self.channels: Optional[int] = None
+
+    def append(self, segment: AudioSegment) -> None:
+        with self._lock:
+            reopened = False
+            if self._file is None:
+                if self.frame_rate is None:
+                    self.sample_width = segment.sample_width
+                    self.frame_rate = segment.frame_rate
+                    self.channels = segment.channels
+                    self._file = open(self.path, "wb")
+                    self._file.write(self._header())
+                else:
+                    # A chunk that arrives after close() (the listener stops asynchronously) is still kept
+                    self._file = open(self.path, "r+b")
+                    reopened = True
+            segment = conform_segment(segment, self.sample_width, self.frame_rate, self.channels)
+            self._file.seek(0, os.SEEK_END)
+            self._file.write(segment.raw_data)
+            self._data_size += len(segment.raw_data)
+            self._patch_header()
+            if reopened:
+                self._file.close()
+                self._file = None
+
+    def _header(self) -> bytes:
+        block_align = self.sample_width * self.channels
+        return struct.pack(
+            "<4sI4s4sIHHIIHH4sI",
+            b"RIFF", 36 + self._data_size, b"WAVE",
+            b"fmt ", 16, 1, self.channels, self.frame_rate, self.frame_rate * block_align, block_align, self.sample_width * 8,
+            b"data", self._data_size
+        )
+
+    def _patch_header(self) -> None:
+        # Caller holds the lock
+        self._file.seek(4)
+        self._file.write(struct.pack("<I", 36 + self._data_size))
+        self._file.seek(40)
+        self._file.write(struct.pack("<I", self._data_size))
+        self._file.flush()
+
+    @property
+    def has_audio(self) -> bool:
+        return self._data_size > 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._patch_header()
+                self._file.close()
+                self._file = None
+
+
+def _find_cut(segment: AudioSegment, target_ms: int, max_ms: int, min_silence_ms: int, silence_thresh: float) -> int:
+    # Position (ms) of the pause closest to target_ms, searching from target_ms / 2 up to max_ms
+    search_from = target_ms // 2
+    silences = detect_silence(segment[search_from:max_ms], min_silence_len=min_silence_ms,
+                              silence_thresh=silence_thresh, seek_step=50)
+    if not silences:
+        return max_ms
+    midpoints = [search_from + (s_start + s_end) // 2 for s_start, s_end in silences]
+    return min(midpoints, key=lambda point: abs(point - target_ms))
+
+
+def stream_windows(blocks: Iterable[AudioSegment], target_ms: int = 60000, max_ms: int = 90000, overlap_ms: int = 1500,
+                   min_silence_ms: int = 400, silence_offset_db: float = 16.0) -> Iterator[AudioSegment]:
+    """Regroup a stream of audio blocks into windows of roughly ``target_ms`` that end in a pause.
+
+    Each window ends at the silence closest to ``target_ms`` (never past ``max_ms``)
+    and extends ``overlap_ms`` into the next one, so words cut at a hard boundary
+    are heard twice and can be deduplicated when the transcripts are stitched.
+    Only about one window of audio is held in memory at a time.
+    """
+    pending: Optional[AudioSegment] = None
+    for block in blocks:
+        pending = block if pending is None else pending + block
+        while len(pending) > max_ms + overlap_ms:
+            cut = _find_cut(pending, target_ms, max_ms, min_silence_ms, pending.dBFS - silence_offset_db)
+            yield pending[:cut + overlap_ms]
+            pending = pending[cut:]
+    if pending is not None and len(pending):
+        yield pending
+
+
+def split_at_silence(segment: AudioSegment, target_ms: int = 60000, max_ms: int = 90000, overlap_ms: int = 1500,
+                     min_silence_ms: int = 400, silence_offset_db: float = 16.0) -> List[AudioSegment]:
+    """Split an in-memory recording into pause-aligned, overlapping windows (see ``stream_windows``)."""
+    return list(stream_windows([segment], target_ms, max_ms, overlap_ms, min_silence_ms, silence_offset_db))
+
+
+def stream_decode(file_path: str, sample_rate: int = UPLOAD_SAMPLE_RATE, channels: int = 1,
+                  block_seconds: float = 30.0) -> Iterator[AudioSegment]:
+    """Decode any file ffmpeg understands and yield it as fixed-size 16-bit PCM blocks.
+
+    ffmpeg writes raw PCM to a pipe that is read ``block_seconds`` at a time, so
+    memory use does not depend on the length of the file.
+    """
+    command = [
+        AudioSegment.converter, "-nostdin", "-loglevel", "error", "-i", file_path,
+        "-vn", "-f", "s16le", "-acodec", "pcm_s16le", "-ac", str(channels), "-ar", str(sample_rate), "-"
+    ]
+    block_bytes = int(block_seconds * sample_rate) * 2 * channels
+    # stderr goes to a file rather than a pipe: a pipe nobody reads until EOF would stall
+    # ffmpeg for good once a damaged file logs more than the pipe buffer holds
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr)
+        try:
+            while True:
+                data = process.stdout.read(block_bytes)
+                if not data:
+                    break
+                yield AudioSegment(data=data, sample_width=2, frame_rate=sample_rate, channels=channels)
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            process.wait()
+            stderr.seek(0)
+            errors = stderr.read().decode(errors="replace").strip()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode {os.path.basename(file_path)}: {errors or process.returncode}")
+
+
+def probe_duration(file_path: str) -> Optional[float]:
+    """Return the duration of a media file in seconds, or None if ffprobe cannot tell."""
+    try:
+        return float(mediainfo(file_path)["duration"])
+    except Exception:
+        return None
+
+
+class VoiceActivityDetector:
+    """Energy-based voice activity detection used to trim audio before upload.
+
+    Audio is cut into ``frame_ms`` frames and each frame's RMS level is compared
+    with ``threshold_db`` (dBFS). Speech frames are padded by ``hangover_ms`` on
+    both sides so word onsets and tails survive; everything else is dropped.
+    Savings are accumulated until ``reset_stats`` is called.
+    """
+
+    def __init__(self, threshold_db: float = -45.0, frame_ms: int = 30, hangover_ms: int = 300,
+                 min_speech_ms: int = 150) -> None:
+        self.threshold_db = threshold_db
+        self.frame_ms = frame_ms
+        self.hangover_ms = hangover_ms
+        self.min_speech_ms = min_speech_ms
+        self._lock = threading.Lock()
+        self.saved_seconds = 0.0
+        self.saved_bytes = 0
+
+    def speech_mask(self, segment: AudioSegment) -> Optional[np.ndarray]:
+        """Return a boolean speech flag per frame, or None if the sample format is unsupported."""
+        if segment.sample_width not in PCM_DTYPES:
+            return None
+        samples = np.frombuffer(segment.raw_data, dtype=PCM_DTYPES[segment.sample_width]).astype(np.float32)
+        if segment.sample_width == 1:
+            samples -= 128.0
+        if segment.channels > 1:
+            samples = samples[:len(samples) - len(samples) % segment.channels].reshape(-1, segment.channels).mean(axis=1)
+        frame_len = max(1, segment.frame_rate * self.frame_ms // 1000)
+        n_frames = -(-len(samples) // frame_len)
+        if not n_frames:
+            return np.zeros(0, dtype=bool)
+        padded = np.zeros(n_frames * frame_len, dtype=np.float32)
+        padded[:len(samples)] = samples
+        rms = np.sqrt(np.mean(padded.reshape(n_frames, frame_len) ** 2, axis=1))
+        full_scale = float(2 ** (8 * segment.sample_width - 1))
+        level_db = 20.0 * np.log10(np.maximum(rms, 1e-9) / full_scale)
+        mask = level_db > self.threshold_db
+        hangover = self.hangover_ms // self.frame_ms
+        if hangover and mask.any():
+            mask = np.convolve(mask.astype(np.int8), np.ones(2 * hangover + 1, dtype=np.int8), mode="same") > 0
+        return mask
+
+    def trim(self, segment: AudioSegment) -> Optional[AudioSegment]:
+        """Return ``segment`` with non-speech frames removed, or None if it holds no speech."""
+        mask = self.speech_mask(segment)
+        if mask is None:
+            return segment
+        original = len(segment.raw_data)
+        if mask.sum() * self.frame_ms < self.min_speech_ms:
+            self._record(original, segment)
+            return None
+        if mask.all():
+            return segment
+        frame_bytes = max(1, segment.frame_rate * self.frame_ms // 1000) * segment.frame_width
+        raw = segment.raw_data
+        # Slicing the raw bytes keeps the short final frame at its real length
+        kept = b"".join(raw[i * frame_bytes:(i + 1) * frame_bytes] for i in np.flatnonzero(mask))
+        self._record(original - len(kept), segment)
+        return segment._spawn(kept)
+
+    def _record(self, dropped_bytes: int, segment: AudioSegment) -> None:
+        with self._lock:
+            self.saved_bytes += dropped_bytes
+            self.saved_seconds += dropped_bytes / float(segment.frame_rate * segment.frame_width)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.saved_seconds = 0.0
+            self.saved_bytes = 0
+
+    def summary(self) -> str:
+        with self._lock:
+            return f"Skipped {self.saved_seconds:.1f} s of silence ({self.saved_bytes / 1024:.0f} KB of raw audio)"
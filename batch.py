@@ -0,0 +1,120 @@
+"""Headless batch transcription and SOAP note generation for a folder of recordings.
+
+Usage:
+    python batch.py [FOLDER] [--workers 2] [--recursive] [--no-soap] [--force]
+
+For every recording, <name>.transcript.txt and <name>.soap.txt are written next
+to the audio file. Outputs that already exist are skipped, so an interrupted run
+resumes where it stopped. FOLDER defaults to the configured storage folder.
+"""
+import os
+import sys
+import argparse
+import logging
+import concurrent.futures
+from typing import List
+from dotenv import load_dotenv
+import openai
+
+from settings import SETTINGS
+from engines import Transcriber
+from transcription import transcribe_file
+from ai import PROVIDER_ENDPOINTS, create_soap_note_checked, get_client
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".ogg", ".opus", ".webm", ".flac", ".aac", ".mp4")
+
+
+def find_recordings(folder: str, recursive: bool) -> List[str]:
+    if recursive:
+        paths = [os.path.join(root, name) for root, _, names in os.walk(folder) for name in names]
+    else:
+        paths = [os.path.join(folder, name) for name in os.listdir(folder)]
+    return sorted(path for path in paths if path.lower().endswith(AUDIO_EXTENSIONS) and os.path.isfile(path))
+
+
+def write_atomic(path: str, text: str) -> None:
+    # Write to a temporary file first so an interrupted run never leaves a truncated output behind
+    temp_path = path + ".part"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+def process_recording(path: str, transcriber: Transcriber, make_soap: bool, force: bool) -> None:
+    base, _ = os.path.splitext(path)
+    transcript_path = f"{base}.transcript.txt"
+    soap_path = f"{base}.soap.txt"
+
+    if os.path.exists(transcript_path) and not force:
+        with open(transcript_path, "r", encoding="utf-8") as f:
+            transcript = f.read()
+    else:
+        errors = []
+
+        def transcribe_window(window) -> str:
+            try:
+                return transcriber.transcribe(window, "import")
+            except Exception as e:
+                errors.append(e)
+                raise
+
+        transcript = transcribe_file(
+            path, transcribe_window,
+            chunk_seconds=SETTINGS.get("import_chunk_seconds", 60),
+            max_workers=SETTINGS.get("import_max_concurrency", 4)
+        )
+        if errors:
+            # Leave no transcript behind so the next run retries this recording
+            raise RuntimeError(f"{len(errors)} chunk(s) failed to transcribe: {errors[0]}")
+        write_atomic(transcript_path, transcript)
+
+    if make_soap and transcript.strip() and (force or not os.path.exists(soap_path)):
+        # Raises on a failed request so no SOAP note is written and the next run retries it
+        write_atomic(soap_path, create_soap_note_checked(transcript))
+
+
+def main() -> None:
+    load_dotenv()
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder", nargs="?", default=SETTINGS.get("default_storage_folder"),
+                        help="Folder of recordings (default: the configured storage folder)")
+    parser.add_argument("--workers", type=int, default=2, help="Recordings processed in parallel")
+    parser.add_argument("--recursive", action="store_true", help="Include subfolders")
+    parser.add_argument("--no-soap", action="store_true", help="Only transcribe; do not create SOAP notes")
+    parser.add_argument("--force", action="store_true", help="Redo recordings that already have outputs")
+    args = parser.parse_args()
+
+    if not args.folder or not os.path.isdir(args.folder):
+        parser.error("a folder of recordings is required (none given and no storage folder configured)")
+    make_soap = not args.no_soap
+    provider = SETTINGS.get("ai_provider", "openai")
+    if provider not in PROVIDER_ENDPOINTS:
+        provider = "openai"
+    if make_soap and get_client(provider) is None:
+        parser.error(f"{PROVIDER_ENDPOINTS[provider][1]} is not set; use --no-soap to only transcribe")
+
+    recordings = find_recordings(args.folder, args.recursive)
+    logging.info(f"Found {len(recordings)} recordings in {args.folder}")
+    transcriber = Transcriber(SETTINGS)
+    failures = 0
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            futures = {pool.submit(process_recording, path, transcriber, make_soap, args.force): path for path in recordings}
+            for done, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+                path = futures[future]
+                try:
+                    future.result()
+                    logging.info(f"[{done}/{len(recordings)}] {os.path.basename(path)}")
+                except Exception:
+                    failures += 1
+                    logging.error(f"[{done}/{len(recordings)}] Failed: {path}", exc_info=True)
+    finally:
+        transcriber.shutdown()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Performance benchmarks for Medical Assistant.
+
+Usage:
+    python benchmarks.py upload <audio file> [--codecs wav flac opus] [--runs 3]
+    python benchmarks.py clients [--calls 50] [--latency-ms 0]
+"""
+import os
+import json
+import time
+import socket
+import argparse
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pydub import AudioSegment
+from dotenv import load_dotenv
+
+from audio import UPLOAD_CODECS, encode_for_upload
+from engines import DeepgramEngine
+from ai import get_client
+
+load_dotenv()
+
+
+def benchmark_upload(file_path: str, codecs: list, runs: int) -> None:
+    """Compare bytes sent and end-to-end Deepgram latency for each upload codec.
+
+    Without DEEPGRAM_API_KEY only encoding time and payload size are measured.
+    """
+    segment = AudioSegment.from_file(file_path)
+    raw_bytes = len(segment.raw_data)
+    print(f"{file_path}: {segment.duration_seconds:.1f} s, {segment.frame_rate} Hz, "
+          f"{segment.channels} ch, {raw_bytes / 1024:.0f} KB raw PCM")
+
+    engine = DeepgramEngine(os.getenv("DEEPGRAM_API_KEY", ""))
+    client = engine.client
+    if client:
+        from deepgram import PrerecordedOptions
+        options = PrerecordedOptions(model=engine.model, language=engine.language)
+
+    print(f"{'codec':<6} {'bytes':>10} {'ratio':>7} {'encode s':>9} {'total s':>9}")
+    for codec in codecs:
+        encode_times, total_times = [], []
+        size = 0
+        for _ in range(runs):
+            start = time.perf_counter()
+            data, _ = encode_for_upload(segment, codec)
+            encoded = time.perf_counter()
+            size = len(data)
+            if client:
+                response = client.listen.rest.v("1").transcribe_file({"buffer": data}, options)
+                json.loads(response.to_json())
+            total_times.append(time.perf_counter() - start)
+            encode_times.append(encoded - start)
+        total = f"{min(total_times):9.2f}" if client else f"{'n/a':>9}"
+        print(f"{codec:<6} {size:>10} {raw_bytes / size:>6.1f}x {min(encode_times):9.3f} {total}")
+
+
+class _MockCompletionHandler(BaseHTTPRequestHandler):
+    """Answers every POST with a fixed chat completion, after an optional delay."""
+
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    connections = 0
+    body = json.dumps({
+        "id": "mock", "object": "chat.completion", "created": 0, "model": "mock",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+    }).encode("utf-8")
+
+    def setup(self) -> None:
+        super().setup()
+        # Headers and body are written separately; without this Nagle's algorithm stalls keep-alive responses
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        type(self).connections += 1
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.latency:
+            time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def benchmark_clients(calls: int, latency_ms: float) -> None:
+    """Compare a new OpenAI client per call with the shared client from ai.get_client.
+
+    Runs against a local mock endpoint, so the difference is client construction
+    and TCP connection setup; against the real providers every new connection
+    also pays a TLS handshake.
+    """
+    import openai
+    _MockCompletionHandler.latency = latency_ms / 1000.0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _MockCompletionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    messages = [{"role": "user", "content": "ping"}]
+
+    def per_call_client():
+        return openai.OpenAI(api_key="mock", base_url=base_url)
+
+    def shared_client():
+        return get_client("openai", base_url=base_url, api_key="mock")
+
+    print(f"{'client':<10} {'calls':>6} {'new conns':>12} {'mean ms':>9} {'p95 ms':>8}")
+    try:
+        for label, factory in (("per-call", per_call_client), ("shared", shared_client)):
+            factory().chat.completions.create(model="mock", messages=messages)  # warm up imports
+            _MockCompletionHandler.connections = 0
+            timings = []
+            for _ in range(calls):
+                start = time.perf_counter()
+                factory().chat.completions.create(model="mock", messages=messages)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            print(f"{label:<10} {calls:>6} {_MockCompletionHandler.connections:>12} "
+                  f"{sum(timings) / len(timings):>9.2f} {p95:>8.2f}")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    upload = subparsers.add_parser("upload", help="Compare upload codecs for Deepgram transcription")
+    upload.add_argument("file", help="Audio file to encode and transcribe")
+    upload.add_argument("--codecs", nargs="+", default=list(UPLOAD_CODECS), choices=list(UPLOAD_CODECS))
+    upload.add_argument("--runs", type=int, default=3, help="Runs per codec; the fastest is reported")
+
+    clients = subparsers.add_parser("clients", help="Compare per-call and shared LLM clients on a local mock endpoint")
+    clients.add_argument("--calls", type=int, default=50, help="Requests per client strategy")
+    clients.add_argument("--latency-ms", type=float, default=0, help="Simulated server processing time")
+
+    args = parser.parse_args()
+    if args.benchmark == "upload":
+        benchmark_upload(args.file, args.codecs, args.runs)
+    elif args.benchmark == "clients":
+        benchmark_clients(args.calls, args.latency_ms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Optional
+
+
+class DiskCache:
+    """Size-bounded on-disk key/value cache with least-recently-used eviction.
+
+    Each entry is a small JSON file named after the SHA-256 of its key. Reads
+    refresh the file's modification time, and once the directory grows past
+    ``max_bytes`` the entries with the oldest modification time are removed.
+    With ``ttl_seconds``, entries older than that are treated as missing and deleted.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 50 * 1024 * 1024, ttl_seconds: Optional[float] = None) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith(".json"))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        with self._lock:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                if self.ttl_seconds is not None and time.time() - entry.get("stored_at", 0) > self.ttl_seconds:
+                    self._size -= os.path.getsize(path)
+                    os.remove(path)
+                    return None
+                os.utime(path)
+            except FileNotFoundError:
+                return None
+            except Exception:
+                logging.error(f"Error reading cache entry {path}", exc_info=True)
+                return None
+        return entry.get("value")
+
+    def set(self, key: str, value: str) -> None:
+        path = self._path(key)
+        data = json.dumps({"key": key, "value": value, "stored_at": time.time()})
+        with self._lock:
+            try:
+                previous = os.path.getsize(path) if os.path.exists(path) else 0
+                temp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+                self._size += os.path.getsize(path) - previous
+                if self._size > self.max_bytes:
+                    self._evict()
+            except Exception:
+                logging.error(f"Error writing cache entry {path}", exc_info=True)
+
+    def _evict(self) -> None:
+        # Caller holds the lock; drop least recently used entries until back under 90% of the limit
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in entries:
+            if self._size <= self.max_bytes * 0.9:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+                self._size -= size
+            except OSError:
+                logging.error(f"Error evicting cache entry {entry.path}", exc_info=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".json"):
+                    os.remove(entry.path)
+            self._size = 0
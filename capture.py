@@ -0,0 +1,187 @@
+import logging
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+import numpy as np
+import speech_recognition as sr
+from audio import PCM_DTYPES
+
+
+class ChunkStats:
+    """Thread-safe record of the chunks produced by an ``AdaptiveChunker``.
+
+    ``latency`` is how much audio was captured after the chunk's content
+    before it was handed to the callback: the pause waited out, or the audio
+    carried over when a chunk hit its maximum length.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.durations: List[float] = []
+            self.latencies: List[float] = []
+            self.reasons: Dict[str, int] = {}
+
+    def record(self, duration: float, latency: float, reason: str) -> None:
+        with self._lock:
+            self.durations.append(duration)
+            self.latencies.append(latency)
+            self.reasons[reason] = self.reasons.get(reason, 0) + 1
+
+    def summary(self) -> str:
+        with self._lock:
+            if not self.durations:
+                return "no chunks"
+            durations = np.array(self.durations)
+            latencies = np.array(self.latencies)
+            reasons = ", ".join(f"{reason} {count}" for reason, count in sorted(self.reasons.items()))
+        return (f"{len(durations)} chunks, "
+                f"duration p50 {np.percentile(durations, 50):.1f} s / p95 {np.percentile(durations, 95):.1f} s, "
+                f"cut latency p50 {np.percentile(latencies, 50) * 1000:.0f} ms / p95 {np.percentile(latencies, 95) * 1000:.0f} ms "
+                f"({reasons})")
+
+
+class AdaptiveChunker:
+    """Split microphone audio into phrases at natural pauses.
+
+    A chunk shorter than ``min_seconds`` only ends after a full
+    ``pause_seconds`` of silence (the end of an utterance). Past the minimum,
+    the pause needed to cut shrinks linearly towards ``short_pause_seconds``
+    so fast talkers are split at their brief breaths. At ``max_seconds`` the
+    chunk is cut at the quietest frame of its last second and the remainder
+    carries over into the next chunk.
+
+    Speech is detected against the recognizer's ``energy_threshold``, adjusted
+    to the room the same way ``Recognizer.listen`` does.
+    """
+
+    def __init__(self, recognizer: sr.Recognizer, min_seconds: float = 2.0, max_seconds: float = 15.0,
+                 pause_seconds: float = 0.8, short_pause_seconds: float = 0.25,
+                 preroll_seconds: float = 0.3, stats: Optional[ChunkStats] = None) -> None:
+        self.recognizer = recognizer
+        self.min_seconds = min_seconds
+        self.max_seconds = max(max_seconds, min_seconds)
+        self.pause_seconds = pause_seconds
+        self.short_pause_seconds = min(short_pause_seconds, pause_seconds)
+        self.preroll_seconds = preroll_seconds
+        self.stats = stats or ChunkStats()
+
+    def required_pause(self, chunk_seconds: float) -> float:
+        if chunk_seconds < self.min_seconds or self.max_seconds <= self.min_seconds:
+            return self.pause_seconds
+        progress = min(1.0, (chunk_seconds - self.min_seconds) / (self.max_seconds - self.min_seconds))
+        return self.pause_seconds - progress * (self.pause_seconds - self.short_pause_seconds)
+
+    def _energy(self, frame: bytes, sample_width: int) -> float:
+        samples = np.frombuffer(frame, dtype=PCM_DTYPES.get(sample_width, np.int16)).astype(np.float32)
+        if sample_width == 1:
+            samples -= 128.0
+        return float(np.sqrt(np.mean(samples ** 2))) if len(samples) else 0.0
+
+    def _adjust_threshold(self, energy: float, seconds_per_frame: float) -> None:
+        # Same damped update as Recognizer.listen, applied only while nobody is speaking
+        if self.recognizer.dynamic_energy_threshold:
+            damping = self.recognizer.dynamic_energy_adjustment_damping ** seconds_per_frame
+            target = energy * self.recognizer.dynamic_energy_ratio
+            self.recognizer.energy_threshold = self.recognizer.energy_threshold * damping + target * (1 - damping)
+
+    def listen_in_background(self, source: sr.Microphone,
+                             callback: Callable[[sr.Recognizer, sr.AudioData], None]) -> Callable[..., None]:
+        """Drop-in replacement for ``Recognizer.listen_in_background``.
+
+        Chunks are passed to ``callback(recognizer, audio)`` from a background
+        thread. The returned stopper flushes the chunk in progress, so the last
+        words before stopping are not lost.
+        """
+        running = threading.Event()
+        running.set()
+
+        def capture() -> None:
+            try:
+                with source as s:
+                    self._capture_loop(s, callback, running)
+            except Exception:
+                logging.error("Adaptive chunker capture error", exc_info=True)
+
+        thread = threading.Thread(target=capture, name="adaptive-chunker", daemon=True)
+        thread.start()
+
+        def stopper(wait_for_stop: bool = True) -> None:
+            running.clear()
+            if wait_for_stop:
+                thread.join(timeout=2)
+
+        return stopper
+
+    def _capture_loop(self, source: sr.Microphone, callback: Callable[[sr.Recognizer, sr.AudioData], None],
+                      running: threading.Event) -> None:
+        seconds_per_frame = float(source.CHUNK) / source.SAMPLE_RATE
+        preroll: Deque[bytes] = deque(maxlen=max(1, int(self.preroll_seconds / seconds_per_frame)))
+        frames: List[bytes] = []
+        energies: List[float] = []
+        silent_frames = 0
+
+        def emit(count: int, latency_frames: int, reason: str) -> None:
+            data = b"".join(frames[:count])
+            self.stats.record(count * seconds_per_frame, latency_frames * seconds_per_frame, reason)
+            try:
+                callback(self.recognizer, sr.AudioData(data, source.SAMPLE_RATE, source.SAMPLE_WIDTH))
+            except Exception:
+                logging.error("Error in chunk callback", exc_info=True)
+            del frames[:count]
+            del energies[:count]
+
+        while running.is_set():
+            frame = source.stream.read(source.CHUNK)
+            if not frame:
+                break
+            energy = self._energy(frame, source.SAMPLE_WIDTH)
+            is_speech = energy > self.recognizer.energy_threshold
+
+            if not frames:
+                # Waiting for speech: keep a short pre-roll so the first syllable is not clipped
+                if not is_speech:
+                    self._adjust_threshold(energy, seconds_per_frame)
+                    preroll.append(frame)
+                    continue
+                frames.extend(preroll)
+                energies.extend([0.0] * len(preroll))
+                preroll.clear()
+                silent_frames = 0
+
+            frames.append(frame)
+            energies.append(energy)
+            silent_frames = 0 if is_speech else silent_frames + 1
+
+            chunk_seconds = len(frames) * seconds_per_frame
+            if silent_frames and silent_frames * seconds_per_frame >= self.required_pause(chunk_seconds):
+                emit(len(frames), silent_frames, "pause")
+                silent_frames = 0
+            elif chunk_seconds >= self.max_seconds:
+                # No pause long enough; cut at the quietest frame of the last second and carry the rest over
+                window = max(1, int(1.0 / seconds_per_frame))
+                start = max(1, len(frames) - window)
+                cut = start + int(np.argmin(energies[start:])) + 1
+                emit(cut, len(frames) - cut, "max")
+                silent_frames = 0
+
+        if frames:
+            emit(len(frames), 0, "stop")
+
+
+def listen_adaptive(recognizer: sr.Recognizer, source: sr.Microphone,
+                    callback: Callable[[sr.Recognizer, sr.AudioData], None], settings: dict,
+                    stats: Optional[ChunkStats] = None) -> Callable[..., None]:
+    """Start an ``AdaptiveChunker`` configured from ``settings``; returns its stopper."""
+    chunker = AdaptiveChunker(
+        recognizer,
+        min_seconds=settings.get("chunk_min_seconds", 2.0),
+        max_seconds=settings.get("chunk_max_seconds", 15.0),
+        pause_seconds=settings.get("chunk_pause_seconds", 0.8),
+        short_pause_seconds=settings.get("chunk_short_pause_seconds", 0.25),
+        stats=stats
+    )
+    return chunker.listen_in_background(source, callback)
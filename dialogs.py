@@ -5,6 +5,7 @@ import tkinter as tk
 from tkinter import messagebox
 import ttkbootstrap as ttk
 import re
+from typing import Optional
 
 # Function to get OpenAI models
 def get_openai_models() -> list:
@@ -315,7 +316,8 @@ def askstring_min(parent: tk.Tk, title: str, prompt: str, initialvalue: str = ""
     dialog.wait_window()
     return result[0]
 
-def ask_conditions_dialog(parent: tk.Tk, title: str, prompt: str, conditions: list) -> str:
+def ask_conditions_dialog(parent: tk.Tk, title: str, prompt: str, conditions: list) -> Optional[str]:
+    """Return the selected conditions as a comma-separated string ("" for none), or None if the dialog was closed."""
     dialog = create_toplevel_dialog(parent, title, "500x500")
     tk.Label(dialog, text=prompt, wraplength=380).pack(padx=20, pady=10)
     style = ttk.Style()
@@ -333,7 +335,9 @@ def ask_conditions_dialog(parent: tk.Tk, title: str, prompt: str, conditions: li
     optional_text = tk.Text(dialog, width=50, height=3)
     optional_text.pack(padx=20, pady=(0,10))
     selected = []
+    confirmed = []
     def on_ok():
+        confirmed.append(True)
         for cond, var in vars_list:
             if var.get():
                 selected.append(cond)
@@ -345,5 +349,7 @@ def ask_conditions_dialog(parent: tk.Tk, title: str, prompt: str, conditions: li
     btn_frame.pack(pady=10)
     tk.Button(btn_frame, text="OK", command=on_ok).pack(side=tk.LEFT, padx=5)
     dialog.wait_window()
-    return ", ".join(selected) if selected else ""
+    if not confirmed:
+        return None
+    return ", ".join(selected)
 
@@ -0,0 +1,377 @@
+import os
+import json
+import time
+import logging
+import threading
+import concurrent.futures
+from collections import deque
+from abc import ABC, abstractmethod
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+import speech_recognition as sr
+from pydub import AudioSegment
+from deepgram import DeepgramClient, PrerecordedOptions
+
+from audio import UPLOAD_SAMPLE_RATE, audio_fingerprint, encode_for_upload
+from cache import DiskCache
+from settings import CACHE_FOLDER
+
+
+class TranscriptionEngine(ABC):
+    """A speech-to-text backend.
+
+    ``transcribe`` returns the transcript of one segment and raises on failure so
+    callers can fall back to another engine. Silence or unintelligible audio is
+    not a failure and yields an empty string.
+    """
+
+    name = ""
+
+    def is_available(self) -> bool:
+        return True
+
+    def cache_id(self) -> str:
+        """Identify everything besides the audio that affects the transcript (engine, model, language)."""
+        return self.name
+
+    @abstractmethod
+    def transcribe(self, segment: AudioSegment) -> str:
+        ...
+
+
+class DeepgramEngine(TranscriptionEngine):
+    name = "deepgram"
+
+    def __init__(self, api_key: str, model: str = "nova-2-medical", language: str = "en-US",
+                 upload_codec: str = "flac") -> None:
+        self.api_key = api_key
+        self.model = model
+        self.language = language
+        self.upload_codec = upload_codec
+        self.client = DeepgramClient(api_key=api_key) if api_key else None
+
+    def is_available(self) -> bool:
+        return self.client is not None
+
+    def cache_id(self) -> str:
+        return f"{self.name}/{self.model}/{self.language}"
+
+    def transcribe(self, segment: AudioSegment) -> str:
+        # Deepgram detects the container from the payload, so only the bytes are sent
+        data, _ = encode_for_upload(segment, self.upload_codec)
+        options = PrerecordedOptions(model=self.model, language=self.language)
+        response = self.client.listen.rest.v("1").transcribe_file({"buffer": data}, options)
+        return json.loads(response.to_json(indent=4))["results"]["channels"][0]["alternatives"][0]["transcript"]
+
+
+class GoogleEngine(TranscriptionEngine):
+    name = "google"
+
+    def __init__(self, language: str = "en-US") -> None:
+        self.language = language
+        self.recognizer = sr.Recognizer()
+
+    def cache_id(self) -> str:
+        return f"{self.name}/{self.language}"
+
+    def transcribe(self, segment: AudioSegment) -> str:
+        # Build AudioData straight from the PCM in memory; no temp file, so concurrent calls are safe
+        if segment.channels != 1:
+            segment = segment.set_channels(1)
+        audio_data = sr.AudioData(segment.raw_data, segment.frame_rate, segment.sample_width)
+        try:
+            return self.recognizer.recognize_google(audio_data, language=self.language)
+        except sr.UnknownValueError:
+            return ""
+
+
+class VoskEngine(TranscriptionEngine):
+    """Offline, CPU-only transcription with a local Vosk model.
+
+    Requires the optional ``vosk`` package and a model directory downloaded from
+    https://alphacephei.com/vosk/models. The model is loaded once on first use.
+    """
+
+    name = "vosk"
+
+    def __init__(self, model_path: str) -> None:
+        self.model_path = model_path
+        self._model = None
+        self._lock = threading.Lock()
+
+    def cache_id(self) -> str:
+        return f"{self.name}/{os.path.basename(os.path.normpath(self.model_path))}"
+
+    def is_available(self) -> bool:
+        if not self.model_path or not os.path.isdir(self.model_path):
+            return False
+        try:
+            import vosk  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                import vosk
+                vosk.SetLogLevel(-1)
+                logging.info(f"Loading Vosk model from {self.model_path}")
+                self._model = vosk.Model(self.model_path)
+            return self._model
+
+    def transcribe(self, segment: AudioSegment) -> str:
+        import vosk
+        segment = segment.set_channels(1).set_frame_rate(UPLOAD_SAMPLE_RATE).set_sample_width(2)
+        recognizer = vosk.KaldiRecognizer(self._get_model(), UPLOAD_SAMPLE_RATE)
+        data = segment.raw_data
+        block = UPLOAD_SAMPLE_RATE  # half a second of 16-bit audio
+        parts = []
+        for start in range(0, len(data), block):
+            if recognizer.AcceptWaveform(data[start:start + block]):
+                parts.append(json.loads(recognizer.Result()).get("text", ""))
+        parts.append(json.loads(recognizer.FinalResult()).get("text", ""))
+        return " ".join(part for part in parts if part)
+
+
+ENGINE_NAMES = ["deepgram", "google", "vosk"]
+ENGINE_DISPLAY_NAMES = {"deepgram": "Deepgram", "google": "Google", "vosk": "Vosk (offline)"}
+
+
+def build_engines(settings: dict, language: Optional[str] = None) -> Dict[str, TranscriptionEngine]:
+    """Create every known engine from environment keys and settings."""
+    language = language or os.getenv("RECOGNITION_LANGUAGE", "en-US")
+    return {
+        "deepgram": DeepgramEngine(
+            os.getenv("DEEPGRAM_API_KEY", ""),
+            upload_codec=settings.get("upload_codec", "flac")
+        ),
+        "google": GoogleEngine(language=language),
+        "vosk": VoskEngine(settings.get("vosk_model_path", "")),
+    }
+
+
+class CircuitBreaker:
+    """Stop calling an engine after repeated failures, then probe it again after a cool-down.
+
+    Closed: calls pass. Open: calls are refused until ``reset_timeout`` seconds
+    have passed. Half-open: calls are let through again; the first success closes
+    the breaker and the first failure opens it for another cool-down.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half-open"
+            return self.state != "open"
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == "half-open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class EngineStats:
+    """Rolling latency and error counts for one engine."""
+
+    def __init__(self, window: int = 50) -> None:
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool) -> None:
+        with self._lock:
+            self.calls += 1
+            if ok:
+                self.latencies.append(latency)
+            else:
+                self.errors += 1
+
+    def p95(self, min_samples: int = 5) -> Optional[float]:
+        with self._lock:
+            if len(self.latencies) < min_samples:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            return self.errors / self.calls if self.calls else 0.0
+
+
+class EngineSupervisor:
+    """Route transcription requests between a primary and a secondary engine.
+
+    Each engine has a circuit breaker, so an engine that keeps failing is
+    skipped straight away instead of costing every chunk a full timeout. With
+    ``hedge`` enabled, a primary request that runs past the primary's p95
+    latency gets a parallel request to the secondary and the first success wins.
+    Latency is tracked per task, since short dictation phrases and minute-long
+    import windows take very different times.
+    With a ``cache``, transcripts are stored under the audio fingerprint plus the
+    engine that produced them, and identical audio is never sent twice.
+    """
+
+    def __init__(self, hedge: bool = True, failure_threshold: int = 3, reset_timeout: float = 30.0,
+                 min_hedge_delay: float = 0.5, max_workers: int = 8,
+                 on_failover: Callable[[TranscriptionEngine, Exception], None] = None,
+                 cache: Optional[DiskCache] = None) -> None:
+        self.hedge = hedge
+        self.cache = cache
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.min_hedge_delay = min_hedge_delay
+        self.on_failover = on_failover
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._stats: Dict[Tuple[str, str], EngineStats] = {}
+        self._lock = threading.Lock()
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="engine")
+
+    def breaker(self, engine: TranscriptionEngine) -> CircuitBreaker:
+        with self._lock:
+            if engine.name not in self._breakers:
+                self._breakers[engine.name] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[engine.name]
+
+    def stats(self, engine: TranscriptionEngine, task: str = "dictation") -> EngineStats:
+        with self._lock:
+            return self._stats.setdefault((engine.name, task), EngineStats())
+
+    def _call(self, engine: TranscriptionEngine, segment: AudioSegment, fingerprint: Optional[str] = None,
+              task: str = "dictation") -> str:
+        start = time.perf_counter()
+        try:
+            result = engine.transcribe(segment)
+        except Exception:
+            self.stats(engine, task).record(time.perf_counter() - start, ok=False)
+            self.breaker(engine).record_failure()
+            raise
+        self.stats(engine, task).record(time.perf_counter() - start, ok=True)
+        self.breaker(engine).record_success()
+        if fingerprint:
+            self.cache.set(f"{engine.cache_id()}:{fingerprint}", result)
+        return result
+
+    def transcribe(self, segment: AudioSegment, primary: Optional[TranscriptionEngine],
+                   secondary: Optional[TranscriptionEngine] = None, task: str = "dictation",
+                   use_cache: bool = True) -> str:
+        engines: List[TranscriptionEngine] = []
+        for engine in (primary, secondary):
+            if engine is not None and engine.is_available() and engine not in engines:
+                engines.append(engine)
+        if not engines:
+            raise RuntimeError("No transcription engine is available.")
+        fingerprint = None
+        if self.cache is not None and use_cache:
+            fingerprint = audio_fingerprint(segment)
+            for engine in engines:
+                cached = self.cache.get(f"{engine.cache_id()}:{fingerprint}")
+                if cached is not None:
+                    logging.info(f"Transcript cache hit ({engine.name})")
+                    return cached
+        allowed = [engine for engine in engines if self.breaker(engine).allow()]
+        if not allowed:
+            # Every breaker is open; the last resort is still better than no transcript
+            allowed = engines[-1:]
+        first = allowed[0]
+        backup = allowed[1] if len(allowed) > 1 else None
+        if backup is None:
+            return self._call(first, segment, fingerprint, task)
+
+        hedge_after = self.stats(first, task).p95() if self.hedge else None
+        if hedge_after is not None:
+            hedge_after = max(hedge_after, self.min_hedge_delay)
+        future = self._pool.submit(self._call, first, segment, fingerprint, task)
+        try:
+            return future.result(timeout=hedge_after)
+        except concurrent.futures.TimeoutError:
+            logging.info(f"{first.name} exceeded its {task} p95 latency ({hedge_after:.2f}s); hedging with {backup.name}")
+            return self._first_success([future, self._pool.submit(self._call, backup, segment, fingerprint, task)])
+        except Exception as e:
+            logging.error(f"{first.name} transcription failed, falling back to {backup.name}", exc_info=True)
+            if self.on_failover:
+                self.on_failover(first, e)
+            return self._call(backup, segment, fingerprint, task)
+
+    def _first_success(self, futures: List[concurrent.futures.Future]) -> str:
+        error = None
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                return future.result()
+            except Exception as e:
+                error = e
+        raise error
+
+    def summary(self) -> str:
+        with self._lock:
+            keys = list(self._stats)
+        parts = []
+        for name, task in keys:
+            stats = self._stats[(name, task)]
+            p95 = stats.p95()
+            parts.append(f"{name} ({task}): {self.breaker_state(name)}, p95 {p95:.2f}s, errors {stats.error_rate():.0%}"
+                         if p95 is not None else f"{name} ({task}): {self.breaker_state(name)}, errors {stats.error_rate():.0%}")
+        return "; ".join(parts)
+
+    def breaker_state(self, name: str) -> str:
+        with self._lock:
+            breaker = self._breakers.get(name)
+        return breaker.state if breaker else "closed"
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False)
+
+
+class Transcriber:
+    """Per-task engine selection, failover and transcript caching, configured from settings.
+
+    Shared by the GUI and the headless batch command so both transcribe the same way.
+    """
+
+    # Only whole recordings are worth caching; live dictation phrases are never transcribed twice
+    CACHED_TASKS = ("import", "soap_note")
+
+    def __init__(self, settings: dict, language: Optional[str] = None,
+                 on_failover: Callable[[TranscriptionEngine, Exception], None] = None) -> None:
+        self.settings = settings
+        self.engines = build_engines(settings, language)
+        cache = None
+        if settings.get("transcript_cache_enabled", True):
+            try:
+                cache = DiskCache(
+                    os.path.join(CACHE_FOLDER, "transcripts"),
+                    max_bytes=int(settings.get("transcript_cache_mb", 100) * 1024 * 1024),
+                    ttl_seconds=settings.get("transcript_cache_ttl_hours", 168) * 3600
+                )
+            except Exception:
+                logging.error("Error opening transcript cache; transcripts will not be cached", exc_info=True)
+        self.supervisor = EngineSupervisor(
+            hedge=settings.get("hedge_transcription", True),
+            on_failover=on_failover,
+            cache=cache
+        )
+
+    def transcribe(self, segment: AudioSegment, task: str = "dictation") -> str:
+        # The engine for each task ("dictation", "soap_note", "import") is chosen in settings
+        selection = self.settings.get("transcription_engines", {})
+        engine = self.engines.get(selection.get(task, "deepgram"))
+        fallback = self.engines.get(selection.get("fallback", "google"))
+        return self.supervisor.transcribe(segment, engine, fallback, task, use_cache=task in self.CACHED_TASKS)
+
+    def shutdown(self) -> None:
+        self.supervisor.shutdown()
@@ -95,3 +95,17 @@ Follow up:
 ** Always return your response in plain text without markdown **
 
 """
+
+# Long transcripts: findings are extracted per section (map) and combined into one SOAP note (reduce)
+SOAP_SECTION_PROMPT_TEMPLATE = (
+    "The following is part {index} of {total} of a patient consultation. Extract every clinically relevant "
+    "finding for a SOAP note as dash-notated lists under Subjective, Objective, Assessment and Plan. "
+    "Keep medications, doses, results and dates exactly as stated. Do not write the SOAP note yet.\n\n"
+    "Transcript part {index}: {text}\n\nFindings:"
+)
+SOAP_SECTION_SYSTEM_MESSAGE = "You are a family practice physician extracting findings from part of a consultation for a SOAP note."
+SOAP_REDUCE_PROMPT_TEMPLATE = (
+    "The following findings were extracted, in order, from consecutive parts of one consultation. "
+    "Merge them, dropping repeats and keeping later corrections, and create a detailed SOAP note:\n\n"
+    "Findings: {text}\n\nSOAP Note:"
+)
@@ -3,6 +3,7 @@ import json
 import logging
 
 SETTINGS_FILE = "settings.json"
+CACHE_FOLDER = "cache"
 DEFAULT_STORAGE_FOLDER = "C:/Users/corte/Documents/Medical-Dictation/Storage"
 
 # NEW: Default AI Provider setting (default is OpenAI)
@@ -101,7 +102,65 @@ Follow up:
     "referral": {
         "prompt": "Write a referral paragraph using the SOAP Note given to you",
         "model": "OpenAI Model"  # Options: OpenAI Model, Perplexity Model, Grok Model
-    }
+    },
+    # Transcribe "Record SOAP Note" chunks in the background while recording
+    "incremental_soap_transcription": True,
+    # Maximum number of live dictation phrases transcribed at the same time
+    "dictation_max_concurrency": 4,
+    # Phrases allowed to wait for a worker; beyond that they are merged into the last waiting one ("merge")
+    # or capture waits for room ("block")
+    "dictation_max_queued": 8,
+    "dictation_queue_overflow": "merge",
+    # Stream live dictation to Deepgram over a websocket instead of one request per phrase
+    "streaming_dictation": False,
+    "deepgram_streaming_url": "wss://api.deepgram.com/v1/listen",
+    # Imported audio longer than this is split at pauses and transcribed in parallel
+    "import_chunk_seconds": 60,
+    "import_max_concurrency": 4,
+    # Energy-based voice activity detection applied before recorded audio is uploaded
+    "vad_enabled": True,
+    "vad_threshold_db": -45.0,
+    # Codec for audio sent to Deepgram: "flac" (lossless), "opus" or "wav"
+    "upload_codec": "flac",
+    # Transcription engine per task ("deepgram", "google" or "vosk") and the engine used when it fails
+    "transcription_engines": {
+        "dictation": "deepgram",
+        "soap_note": "deepgram",
+        "import": "deepgram",
+        "fallback": "google"
+    },
+    # Send a parallel request to the fallback engine when the primary is slower than its p95 latency
+    "hedge_transcription": True,
+    # On-disk cache of imported and SOAP recording transcripts, keyed by a hash of the audio and the engine settings;
+    # entries expire after the TTL
+    "transcript_cache_enabled": True,
+    "transcript_cache_mb": 100,
+    "transcript_cache_ttl_hours": 168,
+    # Folder of a downloaded Vosk model for offline transcription
+    "vosk_model_path": "",
+    # Convert captured audio to 16 kHz mono with peak normalization before it is buffered
+    "normalize_capture": True,
+    # Adaptive phrase chunking: chunks end at a pause once past the minimum and are cut at the maximum
+    "chunk_min_seconds": 2.0,
+    "chunk_max_seconds": 15.0,
+    # Silence that ends a short utterance, shrinking to the short pause as a chunk nears its maximum
+    "chunk_pause_seconds": 0.8,
+    "chunk_short_pause_seconds": 0.25,
+    # Show refine, improve and SOAP note responses token by token as they are generated
+    "stream_ai_responses": True,
+    # Reuse AI responses for identical requests; kept in memory and on disk for up to the TTL
+    "ai_cache_enabled": True,
+    "ai_cache_mb": 20,
+    "ai_cache_ttl_hours": 168,
+    # Transcripts longer than this (estimated tokens) get findings extracted per section before the SOAP note
+    "soap_map_reduce_tokens": 12000,
+    "soap_section_tokens": 4000,
+    "soap_map_concurrency": 4,
+    # Refine and Improve only send new or changed paragraphs, up to this many at once
+    "paragraph_ai_processing": True,
+    "paragraph_max_concurrency": 4,
+    # Extract referral conditions when a SOAP note is created and write the general referral while the dialog is open
+    "speculative_referral": True
 }
 
 def load_settings() -> dict:
@@ -0,0 +1,137 @@
+import json
+import logging
+import threading
+from urllib.parse import urlencode
+from typing import Callable, Optional
+import websocket
+import speech_recognition as sr
+
+DEEPGRAM_LIVE_URL = "wss://api.deepgram.com/v1/listen"
+
+
+class DeepgramStreamingClient:
+    """Minimal client for Deepgram's live transcription websocket.
+
+    Raw linear16 PCM is sent as binary frames and every ``Results`` message is
+    passed to ``on_transcript(text, is_final)`` from the receiver thread. The
+    endpoint is configurable so the client can be pointed at a local stand-in server.
+    """
+
+    def __init__(self, api_key: Optional[str], on_transcript: Callable[[str, bool], None],
+                 sample_rate: int, channels: int = 1, url: str = DEEPGRAM_LIVE_URL,
+                 model: str = "nova-2-medical", language: str = "en-US",
+                 on_error: Callable[[Exception], None] = None) -> None:
+        self.api_key = api_key
+        self.on_transcript = on_transcript
+        self.on_error = on_error
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.url = url
+        self.model = model
+        self.language = language
+        self._ws: Optional[websocket.WebSocket] = None
+        self._receiver: Optional[threading.Thread] = None
+
+    def build_url(self) -> str:
+        params = {
+            "model": self.model,
+            "language": self.language,
+            "encoding": "linear16",
+            "sample_rate": self.sample_rate,
+            "channels": self.channels,
+            "interim_results": "true",
+            "punctuate": "true",
+        }
+        return f"{self.url}?{urlencode(params)}"
+
+    def connect(self, timeout: float = 10) -> None:
+        header = [f"Authorization: Token {self.api_key}"] if self.api_key else []
+        self._ws = websocket.create_connection(self.build_url(), header=header, timeout=timeout)
+        # Results can be several seconds apart during silence; only the connect is time-limited
+        self._ws.settimeout(None)
+        self._receiver = threading.Thread(target=self._receive_loop, name="deepgram-stream", daemon=True)
+        self._receiver.start()
+
+    def send_audio(self, data: bytes) -> None:
+        if self._ws is not None:
+            self._ws.send_binary(data)
+
+    def finish(self, timeout: float = 5) -> None:
+        """Ask the server to flush pending results, wait for them, then close the socket."""
+        if self._ws is None:
+            return
+        try:
+            self._ws.send(json.dumps({"type": "CloseStream"}))
+        except Exception:
+            logging.error("Error closing Deepgram stream", exc_info=True)
+        if self._receiver is not None:
+            self._receiver.join(timeout)
+        self._ws.close()
+        self._ws = None
+
+    def _receive_loop(self) -> None:
+        while True:
+            try:
+                message = self._ws.recv()
+            except websocket.WebSocketConnectionClosedException:
+                break
+            except Exception as e:
+                logging.error("Deepgram stream receive error", exc_info=True)
+                if self.on_error:
+                    self.on_error(e)
+                break
+            if not message:
+                break
+            self.handle_message(message)
+
+    def handle_message(self, message: str) -> None:
+        try:
+            data = json.loads(message)
+        except ValueError:
+            logging.warning("Ignoring non-JSON message from Deepgram stream")
+            return
+        if data.get("type") != "Results":
+            return
+        alternatives = data.get("channel", {}).get("alternatives", [])
+        transcript = alternatives[0].get("transcript", "") if alternatives else ""
+        is_final = bool(data.get("is_final"))
+        if transcript or is_final:
+            self.on_transcript(transcript, is_final)
+
+
+def stream_microphone(mic: sr.Microphone, client: DeepgramStreamingClient,
+                      on_frames: Callable[[bytes], None] = None) -> Callable[..., None]:
+    """Feed microphone frames to ``client`` continuously from a background thread.
+
+    Returns a stopper with the same signature as the one returned by
+    ``Recognizer.listen_in_background``.
+    """
+    running = threading.Event()
+    running.set()
+
+    def capture() -> None:
+        try:
+            with mic as source:
+                while running.is_set():
+                    data = source.stream.read(source.CHUNK)
+                    if not data:
+                        break
+                    client.send_audio(data)
+                    if on_frames:
+                        on_frames(data)
+        except Exception as e:
+            logging.error("Microphone streaming error", exc_info=True)
+            if client.on_error:
+                client.on_error(e)
+        finally:
+            client.finish()
+
+    thread = threading.Thread(target=capture, name="mic-stream", daemon=True)
+    thread.start()
+
+    def stopper(wait_for_stop: bool = True) -> None:
+        running.clear()
+        if wait_for_stop:
+            thread.join()
+
+    return stopper
@@ -0,0 +1,298 @@
+import math
+import string
+import logging
+import threading
+import concurrent.futures
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+from pydub import AudioSegment
+
+from audio import probe_duration, stream_decode, stream_windows
+
+
+class IncrementalTranscriber:
+    """Transcribe recording chunks in the background as they arrive.
+
+    Chunks are submitted to a shared executor the moment they are captured and
+    their transcripts are kept in capture order, so when the recording stops only
+    the chunks still in flight need to be waited on.
+    """
+
+    def __init__(self, transcribe_func: Callable[[AudioSegment], str], executor: concurrent.futures.Executor,
+                 on_update: Callable[[], None] = None) -> None:
+        self.transcribe_func = transcribe_func
+        self.executor = executor
+        self.on_update = on_update
+        self._futures: List[concurrent.futures.Future] = []
+        self._lock = threading.Lock()
+
+    def submit(self, segment: AudioSegment) -> None:
+        future = self.executor.submit(self._transcribe_chunk, segment)
+        with self._lock:
+            self._futures.append(future)
+        if self.on_update:
+            future.add_done_callback(lambda _: self.on_update())
+
+    def _transcribe_chunk(self, segment: AudioSegment) -> str:
+        try:
+            return (self.transcribe_func(segment) or "").strip()
+        except Exception:
+            logging.error("Error transcribing recording chunk", exc_info=True)
+            return ""
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(1 for future in self._futures if not future.done())
+
+    def running_transcript(self) -> str:
+        """Return the transcript of every chunk finished so far, stopping at the first gap."""
+        with self._lock:
+            futures = list(self._futures)
+        parts = []
+        for future in futures:
+            if not future.done():
+                break
+            parts.append(future.result())
+        return " ".join(part for part in parts if part)
+
+    def finish(self, timeout: float = None) -> str:
+        """Wait for all submitted chunks and return the full transcript in capture order."""
+        with self._lock:
+            futures = list(self._futures)
+        concurrent.futures.wait(futures, timeout=timeout)
+        parts = [future.result() for future in futures if future.done()]
+        return " ".join(part for part in parts if part)
+
+    def reset(self) -> None:
+        with self._lock:
+            for future in self._futures:
+                future.cancel()
+            self._futures = []
+
+
+class OrderedTranscriptionPipeline:
+    """Transcribe chunks concurrently and release the results strictly in capture order.
+
+    Every submitted chunk gets a sequence number. Workers may finish in any order;
+    finished transcripts wait in a reorder buffer until all earlier chunks are done.
+
+    At most ``max_queued`` chunks wait for a worker. When the queue is full the
+    ``overflow`` policy applies: ``"merge"`` appends the new audio to the last
+    queued chunk, so a backlog becomes fewer, longer requests instead of growing
+    memory; ``"block"`` makes ``submit`` wait for room, pushing back on the capture
+    thread. ``on_queue_change(queued, in_flight)`` reports the depth whenever it changes.
+    """
+
+    OVERFLOW_POLICIES = ("merge", "block")
+
+    def __init__(self, transcribe_func: Callable[[AudioSegment], str], on_result: Callable[[str], None],
+                 max_concurrency: int = 4, max_queued: int = 8, overflow: str = "merge",
+                 on_queue_change: Callable[[int, int], None] = None) -> None:
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.transcribe_func = transcribe_func
+        self.on_result = on_result
+        self.max_queued = max(1, max_queued)
+        self.overflow = overflow
+        self.on_queue_change = on_queue_change
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._queue: Deque[Tuple[int, AudioSegment]] = deque()
+        self._in_flight = 0
+        self._closed = False
+        self._next_seq = 0
+        self._next_release = 0
+        self._reorder_buffer: Dict[int, str] = {}
+        self.merged_chunks = 0
+        workers = max(1, max_concurrency)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transcribe")
+        for _ in range(workers):
+            self._executor.submit(self._worker)
+
+    def submit(self, segment: AudioSegment) -> int:
+        """Queue ``segment`` and return its sequence number (that of the chunk it was merged into, if any)."""
+        with self._lock:
+            if self.overflow == "block":
+                while len(self._queue) >= self.max_queued and not self._closed:
+                    self._not_full.wait()
+            elif len(self._queue) >= self.max_queued:
+                seq, queued = self._queue.pop()
+                self._queue.append((seq, queued + segment))
+                self.merged_chunks += 1
+                return seq
+            seq = self._next_seq
+            self._next_seq += 1
+            self._queue.append((seq, segment))
+            self._not_empty.notify()
+            depth = (len(self._queue), self._in_flight)
+        self._report(depth)
+        return seq
+
+    def _worker(self) -> None:
+        while True:
+            with self._lock:
+                while not self._queue and not self._closed:
+                    self._not_empty.wait()
+                if self._closed:
+                    return
+                seq, segment = self._queue.popleft()
+                self._in_flight += 1
+                self._not_full.notify()
+                depth = (len(self._queue), self._in_flight)
+            self._report(depth)
+            self._run(seq, segment)
+            with self._lock:
+                self._in_flight -= 1
+                depth = (len(self._queue), self._in_flight)
+            self._report(depth)
+
+    def _report(self, depth: Tuple[int, int]) -> None:
+        if self.on_queue_change:
+            try:
+                self.on_queue_change(*depth)
+            except Exception:
+                logging.error("Error reporting transcription queue depth", exc_info=True)
+
+    def _run(self, seq: int, segment: AudioSegment) -> None:
+        try:
+            text = self.transcribe_func(segment) or ""
+        except Exception:
+            logging.error(f"Error transcribing chunk {seq}", exc_info=True)
+            text = ""
+        self._complete(seq, text)
+
+    def _complete(self, seq: int, text: str) -> None:
+        # Release under the lock so callbacks fire in sequence even when workers finish together
+        with self._lock:
+            if seq < self._next_release:
+                return  # Dropped by reset()
+            self._reorder_buffer[seq] = text
+            while self._next_release in self._reorder_buffer:
+                ready = self._reorder_buffer.pop(self._next_release)
+                self._next_release += 1
+                try:
+                    self.on_result(ready)
+                except Exception:
+                    logging.error("Error delivering transcription result", exc_info=True)
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._next_seq - self._next_release
+
+    def queue_depth(self) -> Tuple[int, int]:
+        """Return ``(queued, in_flight)`` chunk counts."""
+        with self._lock:
+            return len(self._queue), self._in_flight
+
+    def reset(self) -> None:
+        """Discard queued chunks and the results of every chunk submitted so far."""
+        with self._lock:
+            self._queue.clear()
+            self._not_full.notify_all()
+            self._next_release = self._next_seq
+            self._reorder_buffer.clear()
+            self.merged_chunks = 0
+            depth = (0, self._in_flight)
+        self._report(depth)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._queue.clear()
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+        self._executor.shutdown(wait=False)
+
+
+def transcribe_chunks(chunks: Iterable[AudioSegment], transcribe_func: Callable[[AudioSegment], str],
+                      max_workers: int = 4, on_progress: Callable[[int, int], None] = None,
+                      total: Optional[int] = None) -> List[str]:
+    """Transcribe ``chunks`` concurrently on a bounded pool and return the transcripts in order.
+
+    ``chunks`` may be a lazy generator: at most ``2 * max_workers`` chunks are held
+    at once, so streamed audio is transcribed with constant memory. ``total`` is
+    only used for progress reporting and may be an estimate.
+    """
+    max_workers = max(1, max_workers)
+    results: Dict[int, str] = {}
+    submitted = 0
+    done = 0
+
+    def collect(finished: set) -> None:
+        nonlocal done
+        for future in finished:
+            index = pending.pop(future)
+            try:
+                results[index] = (future.result() or "").strip()
+            except Exception:
+                logging.error(f"Error transcribing chunk {index + 1}", exc_info=True)
+                results[index] = ""
+            done += 1
+            if on_progress:
+                on_progress(done, max(total or 0, submitted))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chunk") as pool:
+        pending: Dict[concurrent.futures.Future, int] = {}
+        for index, chunk in enumerate(chunks):
+            if len(pending) >= 2 * max_workers:
+                finished, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                collect(finished)
+            pending[pool.submit(transcribe_func, chunk)] = index
+            submitted += 1
+        finished, _ = concurrent.futures.wait(pending)
+        collect(finished)
+    return [results[index] for index in range(submitted)]
+
+
+def _normalize_word(word: str) -> str:
+    return word.lower().strip(string.punctuation)
+
+
+def _overlap_length(previous: List[str], following: List[str], max_words: int) -> int:
+    prev_norm = [_normalize_word(w) for w in previous[-max_words:]]
+    next_norm = [_normalize_word(w) for w in following[:max_words]]
+    for size in range(min(len(prev_norm), len(next_norm)), 1, -1):
+        if prev_norm[-size:] == next_norm[:size]:
+            return size
+    return 0
+
+
+def stitch_transcripts(parts: List[str], max_overlap_words: int = 25) -> str:
+    """Join transcripts of overlapping windows, dropping words repeated across each boundary.
+
+    The longest run of words that ends one transcript and starts the next is
+    removed from the second. A word clipped at the window edge is tolerated by
+    also trying the match with the boundary word on each side ignored.
+    """
+    words: List[str] = []
+    for part in parts:
+        following = part.split()
+        if not following:
+            continue
+        if words:
+            skip = _overlap_length(words, following, max_overlap_words)
+            if not skip:
+                trimmed = _overlap_length(words[:-1], following[1:], max_overlap_words)
+                if trimmed:
+                    words.pop()
+                    skip = trimmed + 1
+            following = following[skip:]
+        words.extend(following)
+    return " ".join(words)
+
+
+def transcribe_file(file_path: str, transcribe_func: Callable[[AudioSegment], str], chunk_seconds: float = 60,
+                    max_workers: int = 4, on_progress: Callable[[int, int], None] = None) -> str:
+    """Transcribe an audio file of any length and format ffmpeg can decode.
+
+    Decoded PCM is streamed from ffmpeg and regrouped into pause-aligned,
+    overlapping windows that transcribe concurrently, so memory stays constant
+    whatever the length of the file.
+    """
+    chunk_ms = int(chunk_seconds * 1000)
+    duration = probe_duration(file_path)
+    estimate = max(1, math.ceil(duration / chunk_seconds)) if duration else None
+    windows = stream_windows(stream_decode(file_path), target_ms=chunk_ms, max_ms=int(chunk_ms * 1.5))
+    parts = transcribe_chunks(windows, transcribe_func, max_workers=max_workers, on_progress=on_progress, total=estimate)
+    return stitch_transcripts(parts)
@@ -1,14 +1,90 @@
+import logging
+import threading
+from typing import Callable, List, Optional, Tuple
 import pyaudio
 
-def get_valid_microphones() -> list[str]:
+MIC_KEYWORDS = ["microphone", "mic", "input", "usb"]
+
+
+def list_input_devices() -> List[Tuple[int, str]]:
+    """Return ``(PortAudio device index, name)`` for every input device.
+
+    Devices whose names look like microphones come first; if none do, all
+    input devices are returned. A fresh PyAudio instance is used each time
+    because PortAudio only picks up newly plugged devices when initialized.
+    """
     pa = pyaudio.PyAudio()
-    devices = [pa.get_device_info_by_index(i) for i in range(pa.get_device_count())]
-    valid_names = [
-        device["name"]
-        for device in devices
-        if device.get("maxInputChannels", 0) > 0 and any(
-            keyword in device.get("name", "").lower() for keyword in ["microphone", "mic", "input", "usb"]
-        )
-    ]
-    pa.terminate()
-    return valid_names
+    try:
+        devices = []
+        for i in range(pa.get_device_count()):
+            try:
+                devices.append(pa.get_device_info_by_index(i))
+            except Exception:
+                logging.error(f"Error querying audio device {i}", exc_info=True)
+    finally:
+        pa.terminate()
+    inputs = [(int(device["index"]), device.get("name", "")) for device in devices if device.get("maxInputChannels", 0) > 0]
+    mics = [(index, name) for index, name in inputs if any(keyword in name.lower() for keyword in MIC_KEYWORDS)]
+    return mics or inputs
+
+
+class MicrophoneRegistry:
+    """Keeps a cached list of input devices, rescanned on a background thread.
+
+    ``on_change(devices)`` is called from the scanner thread with the new
+    ``(device index, name)`` list whenever it differs from the cached one, and
+    after every explicit ``refresh()``. Timed rescans are skipped while
+    ``is_busy()`` returns True so an open recording stream is never disturbed.
+    """
+
+    def __init__(self, on_change: Callable[[List[Tuple[int, str]]], None], refresh_seconds: float = 10.0,
+                 is_busy: Callable[[], bool] = None) -> None:
+        self.on_change = on_change
+        self.refresh_seconds = refresh_seconds
+        self.is_busy = is_busy
+        self._devices: List[Tuple[int, str]] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._forced = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def devices(self) -> List[Tuple[int, str]]:
+        with self._lock:
+            return list(self._devices)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="mic-registry", daemon=True)
+        self._thread.start()
+
+    def refresh(self) -> None:
+        """Rescan now and report the result even if nothing changed."""
+        with self._lock:
+            self._forced = True
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            with self._lock:
+                forced, self._forced = self._forced, False
+            if forced or not (self.is_busy and self.is_busy()):
+                self._scan(forced)
+            self._wake.wait(self.refresh_seconds)
+            self._wake.clear()
+
+    def _scan(self, forced: bool) -> None:
+        try:
+            devices = list_input_devices()
+        except Exception:
+            logging.error("Error enumerating microphones", exc_info=True)
+            return
+        with self._lock:
+            changed = devices != self._devices
+            self._devices = devices
+        if changed or forced:
+            self.on_change(devices)